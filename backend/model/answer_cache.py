@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from model.bm25 import math_terms
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+# Cosine similarity above which two questions are considered the same
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+_answer_cache: Optional["SemanticAnswerCache"] = None
+_answer_cache_lock = threading.Lock()
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, threshold: float = ANSWER_CACHE_THRESHOLD,
+                 ttl: Optional[float] = ANSWER_CACHE_TTL):
+        """
+        Thread-safe cache of generated answers, looked up by question similarity.
+
+        Entries are grouped by corpus (see `RAGSystem.corpus_version`): a lookup
+        only matches answers generated against the same corpus version, and a
+        newer version drops the corpus' older answers. Within a corpus, the
+        stored question embedding closest to the query wins if its cosine
+        similarity reaches `threshold` and its math terms (see
+        `bm25.math_terms`) are exactly those of the query, so "solve
+        2x + 3 = 7" never gets the answer to "solve 2x + 3 = 9".
+
+        Args:
+            max_size: Maximum number of answers kept, least recently used evicted first.
+            threshold: Minimum cosine similarity between normalized embeddings for a hit.
+            ttl: Seconds an answer stays valid, or None to keep answers until evicted.
+        """
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        # corpus -> (version, OrderedDict[entry id -> (embedding, answer, created, math terms)])
+        self._corpora: Dict[Hashable, Tuple[Hashable, "OrderedDict[int, tuple]"]] = {}
+        # corpus -> (stacked embeddings, entry ids, math terms), rebuilt after changes
+        self._matrices: Dict[Hashable, Tuple[np.ndarray, list, list]] = {}
+        self._lru: "OrderedDict[int, Hashable]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _entries(self, corpus: Hashable, version: Hashable) -> "OrderedDict[int, tuple]":
+        current = self._corpora.get(corpus)
+        if current is None or current[0] != version:
+            if current is not None:
+                self._drop(corpus)
+            current = (version, OrderedDict())
+            self._corpora[corpus] = current
+        return current[1]
+
+    def _drop(self, corpus: Hashable) -> None:
+        _, entries = self._corpora.pop(corpus, (None, {}))
+        for entry_id in entries:
+            self._lru.pop(entry_id, None)
+        self._matrices.pop(corpus, None)
+        self.invalidations += len(entries)
+
+    def _remove(self, corpus: Hashable, entry_id: int) -> None:
+        self._corpora[corpus][1].pop(entry_id, None)
+        self._lru.pop(entry_id, None)
+        self._matrices.pop(corpus, None)
+
+    def get(self, corpus_version: Tuple[Hashable, Hashable], embedding: np.ndarray,
+            question: str = "") -> Optional[Any]:
+        """
+        Return the answer to the most similar cached question, if similar enough.
+
+        Args:
+            corpus_version: (corpus, version) the answer must have been generated against.
+            embedding: Normalized embedding of the new question.
+            question: Text of the new question, whose math terms must match exactly.
+
+        Returns:
+            The cached answer, or None on a miss.
+        """
+        corpus, version = corpus_version
+        with self._lock:
+            entries = self._entries(corpus, version)
+            if self.ttl is not None:
+                now = time.monotonic()
+                for entry_id in [i for i, (_, _, created, _) in entries.items() if now - created > self.ttl]:
+                    self._remove(corpus, entry_id)
+            if not entries:
+                self.misses += 1
+                return None
+
+            matrix = self._matrices.get(corpus)
+            if matrix is None:
+                ids = list(entries)
+                matrix = (np.vstack([entries[i][0] for i in ids]), ids, [entries[i][3] for i in ids])
+                self._matrices[corpus] = matrix
+            similarities = matrix[0] @ np.asarray(embedding, dtype=matrix[0].dtype)
+            terms = math_terms(question)
+            similarities[[stored != terms for stored in matrix[2]]] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = matrix[1][best]
+            self._lru.move_to_end(entry_id)
+            self.hits += 1
+            return entries[entry_id][1]
+
+    def set(self, corpus_version: Tuple[Hashable, Hashable], embedding: np.ndarray, answer: Any,
+            question: str = "") -> None:
+        """Store `answer` for `question` with `embedding`, evicting the least recently used answer if full."""
+        corpus, version = corpus_version
+        with self._lock:
+            entries = self._entries(corpus, version)
+            entry_id = self._next_id
+            self._next_id += 1
+            entries[entry_id] = (np.asarray(embedding, dtype='float32'), answer, time.monotonic(),
+                                 math_terms(question))
+            self._lru[entry_id] = corpus
+            self._matrices.pop(corpus, None)
+            while len(self._lru) > self.max_size:
+                oldest, oldest_corpus = next(iter(self._lru.items()))
+                self._remove(oldest_corpus, oldest)
+                self.evictions += 1
+
+    def invalidate(self, corpus: Optional[Hashable] = None) -> None:
+        """Drop the answers of one corpus, or of every corpus when None."""
+        with self._lock:
+            for name in ([corpus] if corpus is not None else list(self._corpora)):
+                self._drop(name)
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._lru),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """Return the process-wide answer cache, creating it on first use."""
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache()
+        return _answer_cache
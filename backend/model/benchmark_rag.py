@@ -0,0 +1,91 @@
+import argparse
+import time
+import numpy as np
+import faiss
+from typing import Dict, List
+
+from model.rag import (HNSW_EF_SEARCH, INDEX_TYPES, QUANTIZATIONS, configure_search, create_faiss_index,
+                       index_nbytes, select_index_type)
+
+
+def synthetic_corpus(num_vectors: int, dimension: int, num_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """
+    Generate normalized vectors clustered around random centroids.
+
+    Clustered data behaves much more like sentence embeddings than uniform
+    noise, which would make every ANN index look artificially bad.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((num_clusters, dimension)).astype('float32')
+    assignments = rng.integers(0, num_clusters, num_vectors)
+    vectors = centroids[assignments] + 0.5 * rng.standard_normal((num_vectors, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Average fraction of the exact top-k neighbours returned by the ANN index."""
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def benchmark_index(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, top_k: int) -> Dict[str, float]:
+    """Run one query at a time (as the chat path does) and report recall and latency percentiles."""
+    latencies = []
+    found = np.empty((len(queries), top_k), dtype='int64')
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, indices = index.search(query[None, :], top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = indices[0]
+    return {
+        "recall": recall_at_k(found, truth),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+    }
+
+
+def run(sizes: List[int], index_types: List[str], quantizations: List[str], dimension: int, num_queries: int,
+        top_k: int, nprobe: int, ef_search: int) -> None:
+    print(f"{'vectors':>9} {'index':>6} {'quant':>5} {'size_mb':>8} {'build_s':>8} "
+          f"{'recall@' + str(top_k):>9} {'p50_ms':>8} {'p99_ms':>8}")
+    for size in sizes:
+        corpus = synthetic_corpus(size, dimension)
+        queries = synthetic_corpus(num_queries, dimension, seed=1)
+
+        # Exact neighbours from a flat index are the ground truth
+        flat = faiss.IndexFlatL2(dimension)
+        flat.add(corpus)
+        _, truth = flat.search(queries, top_k)
+
+        for index_type in index_types:
+            resolved = select_index_type(size, index_type)
+            # IVF-PQ stores its own compressed codes, scalar quantization does not apply
+            for quantization in (["none"] if resolved == "ivfpq" else quantizations):
+                start = time.perf_counter()
+                index = create_faiss_index(corpus, resolved, quantization)
+                build_seconds = time.perf_counter() - start
+                configure_search(index, nprobe=nprobe, ef_search=ef_search)
+
+                stats = benchmark_index(index, queries, truth, top_k)
+                size_mb = index_nbytes(index) / 2**20
+                print(f"{size:>9} {resolved:>6} {quantization:>5} {size_mb:>8.1f} {build_seconds:>8.2f} "
+                      f"{stats['recall']:>9.3f} {stats['p50_ms']:>8.3f} {stats['p99_ms']:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types on synthetic embedding corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--index-types", nargs="+", default=list(INDEX_TYPES), choices=list(INDEX_TYPES) + ["auto"])
+    parser.add_argument("--quantizations", nargs="+", default=list(QUANTIZATIONS), choices=list(QUANTIZATIONS))
+    parser.add_argument("--dimension", type=int, default=384, help="all-MiniLM-L6-v2 produces 384-dim vectors")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, default=None, help="IVF lists probed per query (default: nlist/16)")
+    parser.add_argument("--ef-search", type=int, default=HNSW_EF_SEARCH, help="HNSW candidate list size per query")
+    args = parser.parse_args()
+    run(args.sizes, args.index_types, args.quantizations, args.dimension, args.queries, args.top_k, args.nprobe, args.ef_search)
+
+
+if __name__ == "__main__":
+    main()
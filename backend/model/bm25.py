@@ -0,0 +1,135 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# Math-aware tokens: compounds such as "x^2" or "dy/dx" are kept whole, and their
+# parts ("x", "2", "dy", "dx") are indexed too so partial matches still score.
+_COMPOUND_RE = re.compile(r"[a-z0-9]+(?:[\^/_][a-z0-9]+)+")
+_PART_RE = re.compile(r"\d+(?:\.\d+)?|[a-z]+")
+_SYMBOL_RE = re.compile(r"[\^/=+*<>()]|\d")
+_OPERATOR_RE = re.compile(r"[-+*/^=<>]")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how i in is it me of on or that the this to was what "
+    "when where which who why with you can do does explain tell".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase search terms, keeping math expressions intact."""
+    text = text.lower()
+    tokens = _COMPOUND_RE.findall(text)
+    for word in re.findall(r"[a-z0-9]+", text):
+        parts = _PART_RE.findall(word)
+        if len(parts) > 1:
+            tokens.append(word)  # e.g. "3x" alongside "3" and "x"
+        tokens.extend(parts)
+    return [t for t in tokens if t not in STOPWORDS]
+
+
+def is_symbolic_query(query: str, max_terms: int = 4) -> bool:
+    """Return True for short queries dominated by math notation, e.g. "x^2 + 3x + 2"."""
+    words = query.split()
+    if not words or len(words) > 2 * max_terms or not _SYMBOL_RE.search(query):
+        return False
+    long_words = [w for w in words if w.isalpha() and len(w) > 2]
+    return len(long_words) <= max_terms // 2
+
+
+def math_terms(text: str) -> Tuple[str, ...]:
+    """
+    Return the numbers, math tokens and operators of `text` in order.
+
+    Two questions with different math terms ("solve 2x + 3 = 7" and
+    "... = 9") ask different things, however similar their wording.
+    """
+    return tuple(t for t in tokenize(text) if _SYMBOL_RE.search(t)) + tuple(_OPERATOR_RE.findall(text))
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Inverted index with Okapi BM25 scoring.
+
+        Documents are identified by their position, matching the positions in
+        the FAISS index and the document store, and can only be appended; removal
+        is handled by rebuilding, like the dense index.
+
+        Args:
+            k1: Term-frequency saturation.
+            b: Document-length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "BM25Index":
+        index = cls()
+        index.add(texts)
+        return index
+
+    def add(self, texts: Iterable[str]) -> None:
+        """Append documents, assigning them the next positions."""
+        for text in texts:
+            position = len(self.doc_lengths)
+            terms = Counter(tokenize(text))
+            length = sum(terms.values())
+            # Length first: a concurrent search may see the new postings and look it up
+            self.doc_lengths.append(length)
+            self.total_length += length
+            for term, tf in terms.items():
+                self.postings[term].append((position, tf))
+
+    def covers(self, query: str) -> bool:
+        """Return True if any query term occurs in the corpus."""
+        return any(term in self.postings for term in tokenize(query))
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Score documents containing any query term.
+
+        Returns:
+            Up to `top_k` (position, score) pairs, best first.
+        """
+        num_docs = len(self.doc_lengths)
+        if not num_docs:
+            return []
+        avg_length = self.total_length / num_docs or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / avg_length)
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Tuple[int, float]]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Fuse several rankings with reciprocal rank fusion.
+
+    Only ranks are used, so BM25 and cosine scores need no calibration.
+
+    Args:
+        rankings: Lists of (position, score) pairs, best first.
+        k: Damping constant; 60 is the usual choice.
+
+    Returns:
+        (position, fused score) pairs, best first.
+    """
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, (position, _) in enumerate(ranking):
+            fused[position] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,73 @@
+import json
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from model.chat_store import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from model.chatbot import get_chat_history, list_chats, main, stream_main
+
+router = APIRouter()
+
+# Mount with: app.include_router(chat_router, prefix="/chat", tags=["chat"])
+# and `await init_chat_store()` / `await close_chat_store()` (model.chat_store) in the app lifespan so
+# indexes are built before the first request rather than on the first write, and buffered writes are
+# flushed on shutdown
+
+
+class ChatRequest(BaseModel):
+    chat_name: str
+    message: str
+    # Search these videos' shards, or a playlist shard narrowed to video_ids; neither means the default transcript
+    video_ids: Optional[List[str]] = None
+    playlist_id: Optional[str] = None
+    start_minute: Optional[int] = None
+    end_minute: Optional[int] = None
+
+    def scope(self):
+        """Keyword arguments selecting what the chat searches."""
+        return {"video_ids": self.video_ids, "playlist_id": self.playlist_id,
+                "start_minute": self.start_minute, "end_minute": self.end_minute}
+
+
+def sse_event(data, event=None):
+    """Format one server-sent event; data is JSON so newlines in tokens survive."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post('')
+async def chat(request: ChatRequest):
+    ai_response = await main(request.chat_name, request.message, **request.scope())
+    return {"response": ai_response, "status": "success"}
+
+
+@router.post('/stream')
+async def chat_stream(request: ChatRequest):
+    async def events():
+        try:
+            async for token in stream_main(request.chat_name, request.message, **request.scope()):
+                yield sse_event({"token": token})
+            yield sse_event({}, event="end")
+        except Exception as e:
+            print(f"❌ Error while streaming chat response: {e}")
+            yield sse_event({"error": str(e)}, event="error")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get('/chats')
+async def chats(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), before: Optional[datetime] = None,
+                before_name: Optional[str] = None):
+    return await list_chats(limit=limit, before=before, before_name=before_name)
+
+
+@router.get('/{chat_name}/messages')
+async def chat_messages(chat_name: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                        before: Optional[datetime] = None, after: Optional[datetime] = None):
+    return await get_chat_history(chat_name, limit=limit, before=before, after=after)
@@ -0,0 +1,540 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from model.shards import DATA_DIR
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = os.getenv("MONGO_DB", "chatbot_db")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "5000"))
+
+# Messages live in fixed-size buckets instead of one ever-growing array per chat
+BUCKET_SIZE = 50
+# Page sizes for history and chat listing
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
+
+# Write-behind: acknowledge turns immediately and persist them in batches
+WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "0").lower() in ("1", "true", "yes")
+FLUSH_BATCH_SIZE = int(os.getenv("CHAT_FLUSH_BATCH_SIZE", "100"))
+FLUSH_INTERVAL = float(os.getenv("CHAT_FLUSH_INTERVAL", "0.5"))
+MAX_PENDING_WRITES = int(os.getenv("CHAT_MAX_PENDING_WRITES", "10000"))
+FLUSH_MAX_BACKOFF = 30.0
+FLUSH_MAX_RETRIES = int(os.getenv("CHAT_FLUSH_MAX_RETRIES", "5"))
+# Batches that still fail after FLUSH_MAX_RETRIES are moved here, one JSON turn per line
+SPILL_PATH = os.getenv("CHAT_SPILL_PATH", os.path.join(DATA_DIR, "chat_spill.jsonl"))
+
+_store: Optional["ChatStore"] = None
+_write_buffer: Optional["WriteBehindBuffer"] = None
+
+
+def to_naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Convert a timezone-aware cursor to the naive UTC datetimes the store keeps."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def bucket_append_op(chat_name: str, message: Dict[str, Any]) -> Tuple[Dict, Dict]:
+    """
+    Filter and update that append one message to the chat's open bucket.
+
+    The filter matches a bucket with room left; when every bucket is full the
+    upsert starts a new one, so an append never touches more than one bucket.
+    """
+    return (
+        {"chat_name": chat_name, "count": {"$lt": BUCKET_SIZE}},
+        {
+            "$push": {"messages": message},
+            "$inc": {"count": 1},
+            "$set": {"last_timestamp": message["timestamp"]},
+            "$setOnInsert": {"first_timestamp": message["timestamp"]}
+        }
+    )
+
+
+def session_touch_op(chat_name: str, now: datetime, messages: int = 1) -> Tuple[Dict, Dict]:
+    """Filter and update that record activity on the chat's session document."""
+    return (
+        {"chat_name": chat_name},
+        {
+            "$set": {"timestamp": now},
+            "$inc": {"message_count": messages},
+            "$setOnInsert": {"session_id": str(now.timestamp()), "ended": False}
+        }
+    )
+
+
+class ChatStore:
+    def __init__(self, db: Any):
+        """
+        Async data access for chat sessions and their bucketed messages.
+
+        Args:
+            db: A Motor database, or any stand-in with the same async API
+                (e.g. mongomock_motor's AsyncMongoMockClient()["chatbot_db"]).
+        """
+        self.db = db
+        self.sessions = db.chat_history
+        self.buckets = db.chat_messages
+        self._indexes_ready = False
+
+    async def ensure_indexes(self) -> None:
+        """
+        Create the collection indexes (idempotent).
+
+        Runs from `init_chat_store` at startup, and otherwise before the first
+        write, so the unique `chat_name` index exists even if the app never
+        calls `init_chat_store`.
+        """
+        if self._indexes_ready:
+            return
+        await self.sessions.create_index([("chat_name", ASCENDING)], unique=True)
+        # Chat listing by last activity; chat_name breaks ties between chats active in the same millisecond
+        await self.sessions.create_index([("timestamp", DESCENDING), ("chat_name", ASCENDING)])
+        # Finds the open (non-full) bucket of a chat on every append
+        await self.buckets.create_index([("chat_name", ASCENDING), ("count", ASCENDING)])
+        # Reads history in order
+        await self.buckets.create_index([("chat_name", ASCENDING), ("first_timestamp", DESCENDING)])
+        self._indexes_ready = True
+
+    async def create_or_get_chat(self, chat_name: str) -> Union[str, Tuple[str, str]]:
+        """Create a new chat session if it doesn't exist, else return existing session."""
+        await self.ensure_indexes()
+        now = datetime.utcnow()
+        session_id = str(now.timestamp())
+        # A single upsert, so two concurrent creates cannot both insert
+        result = await self.sessions.update_one(
+            {"chat_name": chat_name},
+            {"$setOnInsert": {
+                "session_id": session_id,
+                "chat_name": chat_name,
+                "message_count": 0,
+                "timestamp": now,
+                "ended": False
+            }},
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            return ("Chat Created Successfully", session_id)
+        session_data = await self.sessions.find_one({"chat_name": chat_name}, {"session_id": 1})
+        return session_data["session_id"]
+
+    async def store_message(self, chat_name: str, user_message: str, ai_message: str) -> None:
+        """Append one human/AI turn to the chat."""
+        await self.ensure_indexes()
+        now = datetime.utcnow()
+        message = {"human": user_message, "AI": ai_message, "timestamp": now}
+        await self.buckets.update_one(*bucket_append_op(chat_name, message), upsert=True)
+        await self.sessions.update_one(*session_touch_op(chat_name, now), upsert=True)
+
+    async def store_messages(self, turns: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Append many turns with one bulk write per collection.
+
+        Args:
+            turns: (chat_name, message) pairs in the order they happened; each
+                message carries its own timestamp.
+        """
+        if not turns:
+            return
+        await self.ensure_indexes()
+        # Ordered, so appends to the same chat fill its buckets in sequence
+        await self.buckets.bulk_write(
+            [UpdateOne(*bucket_append_op(chat_name, message), upsert=True) for chat_name, message in turns],
+            ordered=True
+        )
+        # One session update per chat, however many turns it had in the batch
+        touched: "OrderedDict[str, List[datetime]]" = OrderedDict()
+        for chat_name, message in turns:
+            touched.setdefault(chat_name, []).append(message["timestamp"])
+        await self.sessions.bulk_write(
+            [UpdateOne(*session_touch_op(chat_name, max(times), len(times)), upsert=True)
+             for chat_name, times in touched.items()],
+            ordered=False
+        )
+
+    async def get_summary(self, chat_name: str) -> Dict[str, Any]:
+        """Return the chat's rolling summary and the timestamp of the last turn it covers."""
+        session_data = await self.sessions.find_one({"chat_name": chat_name},
+                                                    {"_id": 0, "summary": 1, "summarized_until": 1})
+        session_data = session_data or {}
+        return {"summary": session_data.get("summary", ""), "summarized_until": session_data.get("summarized_until")}
+
+    async def set_summary(self, chat_name: str, summary: str, summarized_until: datetime,
+                          previous_until: Optional[datetime]) -> bool:
+        """
+        Replace the rolling summary if nobody else has advanced it meanwhile.
+
+        Args:
+            chat_name: Chat to update.
+            summary: New summary text.
+            summarized_until: Timestamp of the newest turn folded into `summary`.
+            previous_until: `summarized_until` the new summary was built on.
+
+        Returns:
+            True if the summary was stored, False if it had changed concurrently.
+        """
+        result = await self.sessions.update_one(
+            {"chat_name": chat_name, "summarized_until": previous_until},
+            {"$set": {"summary": summary, "summarized_until": summarized_until}}
+        )
+        return result.modified_count == 1
+
+    async def end_chat_session(self, chat_name: str) -> None:
+        """Mark the session as ended; the history stays in its buckets and is not copied."""
+        await self.sessions.update_one(
+            {"chat_name": chat_name},
+            {"$set": {"ended": True, "timestamp": datetime.utcnow()}}
+        )
+
+    async def resume_chat_session(self, chat_name: str) -> List[Dict[str, Any]]:
+        """Fetch all past messages from a session."""
+        session_data = await self.sessions.find_one({"chat_name": chat_name}, {"messages": 1})
+        # Chats stored before bucketing keep their messages on the session document
+        messages = list(session_data.get("messages", [])) if session_data else []
+        cursor = self.buckets.find({"chat_name": chat_name}, {"messages": 1, "_id": 0}).sort("first_timestamp", ASCENDING)
+        async for bucket in cursor:
+            messages.extend(bucket["messages"])
+        return messages
+
+    async def get_chat_pairs(self, chat_name: str) -> List[Dict[str, str]]:
+        """Return the conversation in paired {human, AI} format."""
+        return [{"human": msg["human"], "AI": msg["AI"]} for msg in await self.resume_chat_session(chat_name)]
+
+    async def fetch_all_chat_names(self) -> List[str]:
+        return [chat["chat_name"] async for chat in self.sessions.find({}, {"chat_name": 1, "_id": 0})]
+
+    async def get_messages(self, chat_name: str, limit: int = DEFAULT_PAGE_SIZE, before: Optional[datetime] = None,
+                           after: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Return one page of a chat's history, oldest message first.
+
+        Without a cursor the latest `limit` messages are returned. `before` pages
+        backwards (older messages) and `after` forwards (newer messages); pass the
+        `before`/`after` value of a page to get the next one. Each turn has its own
+        timestamp, so it identifies a message. Only the buckets that overlap the
+        page are read, and `$slice` trims the latest-N read to bucket tails.
+
+        Args:
+            chat_name: Chat to read.
+            limit: Page size, capped at MAX_PAGE_SIZE.
+            before: Only messages strictly older than this timestamp (naive UTC or timezone-aware).
+            after: Only messages strictly newer than this timestamp (naive UTC or timezone-aware).
+
+        Returns:
+            {"messages": [...], "has_more": bool, "before": oldest timestamp, "after": newest timestamp}
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        before, after = to_naive_utc(before), to_naive_utc(after)
+        # One extra message tells whether another page exists
+        wanted = limit + 1
+        forward = after is not None and before is None
+
+        def in_range(message):
+            ts = message["timestamp"]
+            return (before is None or ts < before) and (after is None or ts > after)
+
+        query: Dict[str, Any] = {"chat_name": chat_name}
+        if before is not None:
+            query["first_timestamp"] = {"$lt": before}
+        if after is not None:
+            query["last_timestamp"] = {"$gt": after}
+        if before is None and not forward:
+            # Latest page: every message is in range, so only bucket tails are needed
+            projection = {"messages": {"$slice": -wanted}, "_id": 0}
+        else:
+            projection = {"messages": 1, "_id": 0}
+        cursor = self.buckets.find(query, projection).sort("first_timestamp", ASCENDING if forward else DESCENDING)
+
+        # Chats stored before bucketing keep older messages on the session document
+        page: List[Dict[str, Any]] = await self._legacy_messages(chat_name, wanted, in_range, forward) if forward else []
+        async for bucket in cursor:
+            if len(page) >= wanted:
+                break
+            messages = [m for m in bucket["messages"] if in_range(m)]
+            page = page + messages if forward else messages + page
+        if not forward and len(page) < wanted:
+            page = await self._legacy_messages(chat_name, wanted - len(page), in_range, forward) + page
+
+        has_more = len(page) > limit
+        page = page[:limit] if forward else page[-limit:]
+        return {
+            "messages": page,
+            "has_more": has_more,
+            "before": page[0]["timestamp"] if page else before,
+            "after": page[-1]["timestamp"] if page else after,
+        }
+
+    async def _legacy_messages(self, chat_name: str, count: int, in_range, forward: bool) -> List[Dict[str, Any]]:
+        """First or last `count` in-range messages kept on a pre-bucketing session document."""
+        session_data = await self.sessions.find_one({"chat_name": chat_name, "messages": {"$exists": True}},
+                                                    {"messages": 1, "_id": 0})
+        if not session_data:
+            return []
+        messages = [m for m in session_data["messages"] if in_range(m)]
+        return messages[:count] if forward else messages[-count:]
+
+    async def list_chats(self, limit: int = DEFAULT_PAGE_SIZE, before: Optional[datetime] = None,
+                         before_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Return one page of chats, most recently active first.
+
+        Args:
+            limit: Page size, capped at MAX_PAGE_SIZE.
+            before: Only chats last active before this timestamp.
+            before_name: Chat name the previous page ended on; with `before` it
+                resumes exactly after that chat even if others share its timestamp.
+
+        Returns:
+            {"chats": [{chat_name, timestamp, message_count, ended}], "has_more": bool,
+             "before": timestamp, "before_name": chat name}
+        """
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        before = to_naive_utc(before)
+        if before is None:
+            query = {}
+        elif before_name is None:
+            query = {"timestamp": {"$lt": before}}
+        else:
+            query = {"$or": [{"timestamp": {"$lt": before}}, {"timestamp": before, "chat_name": {"$gt": before_name}}]}
+        # Never load the (legacy) message arrays when listing
+        projection = {"_id": 0, "chat_name": 1, "timestamp": 1, "message_count": 1, "ended": 1}
+        cursor = self.sessions.find(query, projection).sort([("timestamp", DESCENDING), ("chat_name", ASCENDING)]).limit(limit + 1)
+        chats = [chat async for chat in cursor]
+        has_more = len(chats) > limit
+        chats = chats[:limit]
+        return {
+            "chats": chats,
+            "has_more": has_more,
+            "before": chats[-1]["timestamp"] if chats else before,
+            "before_name": chats[-1]["chat_name"] if chats else before_name,
+        }
+
+
+class WriteBehindBuffer:
+    def __init__(self, store: ChatStore, batch_size: int = FLUSH_BATCH_SIZE, interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING_WRITES, max_retries: int = FLUSH_MAX_RETRIES,
+                 spill_path: str = SPILL_PATH):
+        """
+        Queue chat turns and persist them in the background with bulk writes.
+
+        A batch is flushed when it reaches `batch_size` turns or `interval`
+        seconds after its first turn, whichever comes first. Failed flushes are
+        retried with exponential backoff; a retry after a partially applied bulk
+        write can store a turn twice. A batch that still fails after
+        `max_retries` retries is appended to `spill_path` instead, so one bad
+        batch cannot hold up every write behind it. Turns not written yet are
+        returned by `pending_messages`, which history reads merge in.
+
+        Args:
+            store: Store the batches are written to.
+            batch_size: Maximum turns per bulk write.
+            interval: Maximum seconds a turn waits for its batch to fill.
+            max_pending: Queue bound; submit() waits when it is reached.
+            max_retries: Retries of a failed batch before it is spilled.
+            spill_path: JSON lines file receiving the turns of abandoned batches.
+        """
+        self.store = store
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.spill_path = spill_path
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Submitted turns until their batch is written or spilled, in submission order
+        self._unwritten: "deque[Tuple[str, Dict[str, Any]]]" = deque()
+        self.written = 0
+        self.batches = 0
+        self.retries = 0
+        self.spilled = 0
+
+    def start(self) -> None:
+        """Start the flush loop on the running event loop (idempotent)."""
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, chat_name: str, user_message: str, ai_message: str) -> None:
+        """Queue one turn; returns as soon as it is buffered."""
+        self.start()
+        message = {"human": user_message, "AI": ai_message, "timestamp": datetime.utcnow()}
+        self._unwritten.append((chat_name, message))
+        await self._queue.put((chat_name, message))
+
+    def pending_messages(self, chat_name: str) -> List[Dict[str, Any]]:
+        """Return the chat's turns that are not written yet, oldest first."""
+        return [message for name, message in self._unwritten if name == chat_name]
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": self.pending, "written": self.written, "batches": self.batches, "retries": self.retries,
+                "spilled": self.spilled}
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # Drain whatever was queued behind the stop marker
+        batch = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        try:
+            await self._write(batch)
+        finally:
+            # Batches are taken in submission order, so the batch is the oldest unwritten turns
+            for _ in batch:
+                self._unwritten.popleft()
+
+    async def _write(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        delay = self.interval or 0.1
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.store.store_messages(batch)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"❌ Error flushing {len(batch)} chat messages, giving up after {attempt + 1} attempts: {e}")
+                    self._spill(batch)
+                    return
+                self.retries += 1
+                print(f"❌ Error flushing {len(batch)} chat messages, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, FLUSH_MAX_BACKOFF)
+            else:
+                self.written += len(batch)
+                self.batches += 1
+                return
+
+    def _spill(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Append the turns of an abandoned batch to the spill file for later replay."""
+        try:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for chat_name, message in batch:
+                    record = dict(message, chat_name=chat_name, timestamp=message["timestamp"].isoformat())
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except Exception as e:
+            print(f"❌ Error spilling {len(batch)} chat messages to {self.spill_path}, they are lost: {e}")
+            return
+        self.spilled += len(batch)
+        print(f"❌ Moved {len(batch)} unwritten chat messages to {self.spill_path}")
+
+    async def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Flush every queued turn and stop the flush loop.
+
+        Args:
+            timeout: Seconds to wait for the drain; on expiry the loop is
+                cancelled and the turns still queued are reported as lost.
+        """
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+            print(f"✅ Chat write buffer drained ({self.written} messages written)")
+        except asyncio.TimeoutError:
+            print(f"❌ Chat write buffer did not drain in time, {self.pending} messages not written")
+        self._unwritten.clear()
+        self._task = None
+        self._queue = None
+
+
+def create_client(uri: str = MONGO_URI) -> AsyncIOMotorClient:
+    """Create a pooled Motor client; connections are opened lazily up to the pool limit."""
+    return AsyncIOMotorClient(
+        uri,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=MONGO_TIMEOUT_MS,
+    )
+
+
+def get_chat_store() -> ChatStore:
+    """Return the process-wide chat store, creating its client on first use."""
+    global _store
+    if _store is None:
+        _store = ChatStore(create_client()[MONGO_DB])
+    return _store
+
+
+def set_chat_store(store: ChatStore) -> None:
+    """Replace the process-wide chat store, e.g. with one backed by an in-memory mock."""
+    global _store
+    _store = store
+
+
+def get_write_buffer() -> WriteBehindBuffer:
+    """Return the process-wide write-behind buffer over the chat store."""
+    global _write_buffer
+    if _write_buffer is None:
+        _write_buffer = WriteBehindBuffer(get_chat_store())
+    return _write_buffer
+
+
+def pending_turns(chat_name: str) -> List[Dict[str, Any]]:
+    """Return the chat's turns still waiting in the write-behind buffer, oldest first."""
+    return _write_buffer.pending_messages(chat_name) if _write_buffer is not None else []
+
+
+async def store_turn(chat_name: str, user_message: str, ai_message: str) -> None:
+    """Persist one turn, through the write-behind buffer when CHAT_WRITE_BEHIND is set."""
+    if WRITE_BEHIND:
+        await get_write_buffer().submit(chat_name, user_message, ai_message)
+    else:
+        await get_chat_store().store_message(chat_name, user_message, ai_message)
+
+
+async def init_chat_store() -> ChatStore:
+    """Create the store and its indexes; call from the app's startup/lifespan hook."""
+    store = get_chat_store()
+    await store.ensure_indexes()
+    if WRITE_BEHIND:
+        get_write_buffer().start()
+    return store
+
+
+async def close_chat_store(timeout: Optional[float] = None) -> None:
+    """Drain pending writes; call from the app's shutdown/lifespan hook."""
+    if _write_buffer is not None:
+        await _write_buffer.close(timeout)
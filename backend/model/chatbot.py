@@ -1,18 +1,15 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.memory import ConversationBufferMemory
 from langchain.chains import ConversationChain
-from pymongo import MongoClient
-from datetime import datetime
 from dotenv import load_dotenv
-from model.conversation import conversation
+from model.chat_store import DEFAULT_PAGE_SIZE, get_chat_store, store_turn
+from model.conversation import conversation, conversation_stream
+from model.memory import get_memory
 import os
 import json
 load_dotenv()
 
-# MongoDB Connection
-client = MongoClient("mongodb://localhost:27017/")
-db = client.chatbot_db
-chat_collection = db.chat_history
+# MongoDB access goes through the async, pooled ChatStore (model/chat_store.py)
 
 # # Gemini AI Model
 # llm = ChatGoogleGenerativeAI(model="gemini-pro", google_api_key=os.getenv("GEMINI_API_KEY"))
@@ -20,21 +17,11 @@ chat_collection = db.chat_history
 # # Memory to store last 3 conversations
 # memory = ConversationBufferMemory(k=3)
 # conversation = ConversationChain(llm=llm, memory=memory, verbose=True)
+# Replaced by model.memory: recent turns plus a rolling summary under a token budget
 
-def create_or_get_chat(chat_name):
+async def create_or_get_chat(chat_name):
     """Create a new chat session if it doesn't exist, else return existing session."""
-    session_data = chat_collection.find_one({"chat_name": chat_name})
-    if session_data:
-        return session_data["session_id"]
-    session_id = str(datetime.utcnow().timestamp())
-    chat_collection.insert_one({
-        "session_id": session_id,
-        "chat_name": chat_name,
-        "messages": [],
-        "timestamp": datetime.utcnow(),
-        "ended": False
-    })
-    return ("Chat Created Successfully",session_id)
+    return await get_chat_store().create_or_get_chat(chat_name)
 
 # def load_past_conversations(chat_name):
 #     """Load the last 3 messages from a given chat into memory."""
@@ -44,58 +31,60 @@ def create_or_get_chat(chat_name):
 #             memory.chat_memory.add_user_message(msg["human"])
 #             memory.chat_memory.add_ai_message(msg["AI"])
 
-def store_chat_in_mongo(chat_name, user_message, ai_message):
-    """Store the conversation messages in MongoDB."""
-    chat_collection.update_one(
-        {"chat_name": chat_name},
-        {
-            "$push": {
-                "messages": {
-                    "human": user_message,
-                    "AI": ai_message,
-                    "timestamp": datetime.utcnow()
-                }
-            },
-            "$set": {"timestamp": datetime.utcnow()}
-        },
-        upsert=True
-    )
-
-def end_chat_session(chat_name):
-    """Mark the session as ended and store conversation in paired {human, AI} format."""
-    session_data = chat_collection.find_one({"chat_name": chat_name})
-    if session_data and "messages" in session_data:
-        chat_pairs = [
-            {"human": msg["human"], "AI": msg["AI"]}
-            for msg in session_data["messages"]
-        ]
-        chat_collection.update_one(
-            {"chat_name": chat_name},
-            {
-                "$set": {
-                    "chat_pairs": chat_pairs,
-                    "ended": True,
-                    "timestamp": datetime.utcnow()
-                }
-            }
-        )
-
-def resume_chat_session(chat_name):
+async def store_chat_in_mongo(chat_name, user_message, ai_message):
+    """Store the conversation messages in MongoDB (buffered when CHAT_WRITE_BEHIND is set)."""
+    await store_turn(chat_name, user_message, ai_message)
+
+async def end_chat_session(chat_name):
+    """Mark the session as ended; the history stays in its buckets and is not copied."""
+    await get_chat_store().end_chat_session(chat_name)
+
+async def get_chat_pairs(chat_name):
+    """Return the conversation in paired {human, AI} format."""
+    return await get_chat_store().get_chat_pairs(chat_name)
+
+async def resume_chat_session(chat_name):
     """Fetch all past messages from a session."""
-    session_data = chat_collection.find_one({"chat_name": chat_name})
-    return session_data["messages"] if session_data and "messages" in session_data else []
+    return await get_chat_store().resume_chat_session(chat_name)
 
-def fetch_all_chat_names():
-    chat_names = [chat["chat_name"] for chat in chat_collection.find({}, {"chat_name": 1, "_id": 0})]
-    
-    return chat_names
+async def fetch_all_chat_names():
+    return await get_chat_store().fetch_all_chat_names()
+
+async def get_chat_history(chat_name, limit=DEFAULT_PAGE_SIZE, before=None, after=None):
+    """Return one page of a chat's history; see ChatStore.get_messages."""
+    return await get_chat_store().get_messages(chat_name, limit=limit, before=before, after=after)
 
-def main(chat_name,user_message):
+async def list_chats(limit=DEFAULT_PAGE_SIZE, before=None, before_name=None):
+    """Return one page of chats, most recently active first; see ChatStore.list_chats."""
+    return await get_chat_store().list_chats(limit=limit, before=before, before_name=before_name)
+
+async def main(chat_name,user_message, video_ids=None, playlist_id=None, start_minute=None, end_minute=None):
     # create_or_get_chat(chat_name)
     # if end_session == True:
     #     end_chat_session(chat_name)
     #     print("Chat session ended.")
     
-    ai_response = conversation(user_message)
-    store_chat_in_mongo(chat_name, user_message, ai_response)
-    return ai_response
\ No newline at end of file
+    memory = get_memory()
+    history = await memory.build_history(chat_name)
+    ai_response = await conversation(user_message, history, video_ids, playlist_id, start_minute, end_minute)
+    await store_chat_in_mongo(chat_name, user_message, ai_response)
+    memory.schedule_update(chat_name)
+    return ai_response
+
+async def stream_main(chat_name, user_message, video_ids=None, playlist_id=None, start_minute=None,
+                      end_minute=None):
+    """
+    Yield the AI response as it streams, storing the full message once it is complete.
+
+    The video, playlist and minute selection is passed on to `conversation_stream`.
+    """
+    memory = get_memory()
+    history = await memory.build_history(chat_name)
+    chunks = []
+    async for token in conversation_stream(user_message, history, video_ids, playlist_id, start_minute, end_minute):
+        chunks.append(token)
+        yield token
+
+    # Only a finished answer is persisted; an aborted stream stores nothing
+    await store_chat_in_mongo(chat_name, user_message, "".join(chunks))
+    memory.schedule_update(chat_name)
\ No newline at end of file
@@ -0,0 +1,136 @@
+import os
+import re
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+# all-MiniLM-L6-v2 truncates at 256 word pieces; stay well below it
+CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "128"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP", "32"))
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Cheap token estimate: words and punctuation/math symbols count one each."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` after its first `max_tokens` tokens (as counted by `count_tokens`)."""
+    for i, match in enumerate(_TOKEN_RE.finditer(text)):
+        if i == max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def transcript_segments(data: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Yield timed segments from transcript JSON.
+
+    Handles caption lists from `youtube_transcriber` (`text`, `start`,
+    `duration`) and minute dicts from `group_transcript_by_minute`. Segments
+    carry `text`, `start` and `end` in seconds, plus `video_id` when present.
+    """
+    if isinstance(data, dict):
+        for minute, text in data.items():
+            if isinstance(text, str) and text.strip():
+                yield {"text": text, "start": int(minute) * 60.0, "end": (int(minute) + 1) * 60.0}
+    elif isinstance(data, list):
+        for item in data:
+            if not isinstance(item, dict) or not item.get("text"):
+                continue
+            start = float(item["start"])
+            end = float(item["end"]) if "end" in item else start + float(item.get("duration", 0))
+            segment = {"text": item["text"], "start": start, "end": end}
+            if "video_id" in item:
+                segment["video_id"] = item["video_id"]
+            yield segment
+
+
+def is_timed_transcript(data: Any) -> bool:
+    """Return True if `data` looks like a timed transcript that `transcript_segments` understands."""
+    if isinstance(data, dict):
+        return bool(data) and all(str(k).isdigit() for k in data)
+    if isinstance(data, list):
+        return bool(data) and all(isinstance(item, dict) and "start" in item for item in data)
+    return False
+
+
+def _split_long_segment(segment: Dict[str, Any], max_tokens: int,
+                        count: Callable[[str], int]) -> Iterator[Dict[str, Any]]:
+    """Split a segment longer than `max_tokens`, interpolating timestamps by word position."""
+    words = segment["text"].split()
+    start, end = segment["start"], segment["end"]
+    piece, piece_start = [], 0
+    for i, word in enumerate(words):
+        if piece and count(" ".join(piece + [word])) > max_tokens:
+            yield dict(segment, text=" ".join(piece),
+                       start=start + (end - start) * piece_start / len(words),
+                       end=start + (end - start) * i / len(words))
+            piece, piece_start = [], i
+        piece.append(word)
+    if piece:
+        yield dict(segment, text=" ".join(piece),
+                   start=start + (end - start) * piece_start / len(words), end=end)
+
+
+def chunk_segments(segments: Iterable[Dict[str, Any]], max_tokens: int = CHUNK_TOKENS,
+                   overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                   count: Optional[Callable[[str], int]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Group transcript segments into token-bounded, overlapping windows.
+
+    Consumes `segments` lazily and yields each window as soon as it is full,
+    so a live transcription can feed index insertion as it goes. Consecutive
+    windows share trailing segments worth up to `overlap_tokens`. Windows
+    never span two videos.
+
+    Args:
+        segments: Dicts with `text`, `start` and `end` (seconds), optionally `video_id`.
+        max_tokens: Token budget per window.
+        overlap_tokens: Tokens repeated from the end of one window at the start of the next.
+        count: Token counter, defaults to `count_tokens`.
+
+    Yields:
+        Dicts with `text`, `start`, `end` and, for playlists, `video_id`.
+    """
+    count = count or count_tokens
+    window = deque()  # (segment, tokens)
+    window_tokens = 0
+    fresh = False  # whether the window holds anything not yet emitted
+
+    def emit():
+        first = window[0][0]
+        chunk = {
+            "text": " ".join(seg["text"].strip() for seg, _ in window),
+            "start": first["start"],
+            "end": window[-1][0]["end"],
+        }
+        if "video_id" in first:
+            chunk["video_id"] = first["video_id"]
+        return chunk
+
+    for segment in segments:
+        if window and segment.get("video_id") != window[0][0].get("video_id"):
+            if fresh:
+                yield emit()
+            window.clear()
+            window_tokens, fresh = 0, False
+
+        tokens = count(segment["text"])
+        pieces = [segment] if tokens <= max_tokens else list(_split_long_segment(segment, max_tokens, count))
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count(piece["text"])
+            if window and window_tokens + piece_tokens > max_tokens:
+                if fresh:
+                    yield emit()
+                # Keep the tail of the window as overlap for the next one
+                while window and (window_tokens > overlap_tokens or window_tokens + piece_tokens > max_tokens):
+                    window_tokens -= window.popleft()[1]
+                fresh = False
+            window.append((piece, piece_tokens))
+            window_tokens += piece_tokens
+            fresh = True
+
+    if window and fresh:
+        yield emit()
@@ -0,0 +1,134 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Set
+
+from model.chunker import count_tokens, truncate_tokens
+
+# Tokens of retrieved transcript allowed in one prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKENS", "600"))
+# Results retrieved per question before compression
+CONTEXT_CANDIDATES = int(os.getenv("RAG_CONTEXT_CANDIDATES", "5"))
+# Passages of one video closer than this many seconds are merged
+MERGE_GAP_SECONDS = 5.0
+# Share of a passage's word trigrams found in a kept passage above which it is dropped
+DUPLICATE_THRESHOLD = 0.8
+# A passage is cut to fit the remaining budget only if at least this many tokens remain
+MIN_PARTIAL_TOKENS = 40
+# Longest overlap looked for between neighbouring chunks, in words
+MAX_OVERLAP_WORDS = 200
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def to_passage(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a search result into the text, timing and score used for assembly."""
+    metadata = result.get("metadata", {})
+    start, end = metadata.get("start"), metadata.get("end")
+    return {
+        "text": result["content"].strip(),
+        "video_id": metadata.get("video_id"),
+        "start": float(start) if start is not None else None,
+        "end": float(end) if end is not None else (float(start) if start is not None else None),
+        "score": result.get("score", 0.0),
+    }
+
+
+def join_overlapping(first: str, second: str) -> str:
+    """Concatenate two texts, dropping the words `second` repeats from the end of `first`."""
+    words_first, words_second = first.split(), second.split()
+    if " ".join(words_second) in " ".join(words_first):
+        return first
+    for k in range(min(len(words_first), len(words_second), MAX_OVERLAP_WORDS), 0, -1):
+        if words_first[-k:] == words_second[:k]:
+            return " ".join(words_first + words_second[k:])
+    return f"{first} {second}"
+
+
+def merge_adjacent(passages: List[Dict[str, Any]], gap: float = MERGE_GAP_SECONDS) -> List[Dict[str, Any]]:
+    """
+    Merge passages of the same video that overlap or are within `gap` seconds.
+
+    Chunks are cut with overlapping windows, so neighbours usually share text;
+    the shared words are kept once. Passages without timing are left as they are.
+    """
+    timed = sorted((p for p in passages if p["start"] is not None),
+                   key=lambda p: (p["video_id"] or "", p["start"]))
+    merged: List[Dict[str, Any]] = []
+    for passage in timed:
+        last = merged[-1] if merged else None
+        if last and last["video_id"] == passage["video_id"] and passage["start"] <= last["end"] + gap:
+            last["text"] = join_overlapping(last["text"], passage["text"])
+            last["end"] = max(last["end"], passage["end"])
+            last["score"] = max(last["score"], passage["score"])
+        else:
+            merged.append(dict(passage))
+    return merged + [dict(p) for p in passages if p["start"] is None]
+
+
+def _trigrams(text: str) -> Set[tuple]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < 3:
+        return {tuple(words)}
+    return set(zip(words, words[1:], words[2:]))
+
+
+def drop_duplicates(passages: List[Dict[str, Any]], threshold: float = DUPLICATE_THRESHOLD) -> List[Dict[str, Any]]:
+    """Drop passages mostly contained in a higher-scoring one (word trigram containment)."""
+    kept, kept_grams = [], []
+    for passage in sorted(passages, key=lambda p: p["score"], reverse=True):
+        grams = _trigrams(passage["text"])
+        if any(len(grams & other) >= threshold * min(len(grams), len(other)) for other in kept_grams):
+            continue
+        kept.append(passage)
+        kept_grams.append(grams)
+    return kept
+
+
+def fit_budget(passages: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+    """Keep the best-scoring passages within `token_budget` tokens, cutting the last one if worthwhile."""
+    kept, remaining = [], token_budget
+    for passage in sorted(passages, key=lambda p: p["score"], reverse=True):
+        tokens = count_tokens(passage["text"])
+        if tokens <= remaining:
+            kept.append(passage)
+            remaining -= tokens
+        elif remaining >= MIN_PARTIAL_TOKENS:
+            kept.append(dict(passage, text=truncate_tokens(passage["text"], remaining) + " ..."))
+            remaining = 0
+        if remaining <= 0:
+            break
+    return kept
+
+
+def _clock(seconds: float) -> str:
+    return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
+
+
+def format_passage(passage: Dict[str, Any]) -> str:
+    if passage["start"] is None:
+        return passage["text"]
+    source = f"{passage['video_id']} " if passage["video_id"] else ""
+    return f"[{source}{_clock(passage['start'])}-{_clock(passage['end'])}]\n{passage['text']}"
+
+
+def assemble_context(results: List[Dict[str, Any]], token_budget: Optional[int] = None) -> str:
+    """
+    Turn search results into compact prompt context.
+
+    Overlapping and adjacent chunks are merged, near-duplicates dropped, the
+    best passages kept within `token_budget` tokens and then ordered by video
+    and timestamp so the transcript reads in order.
+
+    Args:
+        results: Search results from `RAGSystem.search`.
+        token_budget: Maximum tokens of transcript, defaults to CONTEXT_TOKEN_BUDGET.
+
+    Returns:
+        The context string for the prompt.
+    """
+    if not results:
+        return "No relevant documents found."
+    passages = merge_adjacent([to_passage(r) for r in results])
+    passages = fit_budget(drop_duplicates(passages), CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget)
+    passages.sort(key=lambda p: (p["start"] is None, p["video_id"] or "", p["start"] or 0.0))
+    return "\n\n".join(format_passage(p) for p in passages)
@@ -1,16 +1,18 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import asyncio
 import os
 import json
 from dotenv import load_dotenv
-from model.rag import rag_main
+from model.answer_cache import get_answer_cache
+from model.llm_client import get_llm_client
+from model.rag import corpus_version as scope_corpus_version, get_rag_system, rag_main_async
+from model.router import route
 
 load_dotenv()
 
-def conversation(user_message):
-    transcript_file = r"A:\Projects\Edu_Pro\backend\data\single.json"
-    content = rag_main(user_message)
-    print("The rag provided content is",content)
+FOLLOWUP_CONTENT = "None needed, answer from the conversation so far."
+
+def build_prompt(user_message, content, history=""):
+    history_block = f"Conversation so far:\n{history}\n" if history else ""
     if user_message.lower() in ["hi", "hii", "hello", "hey"]:
         print("If working")
         prompt = f"""
@@ -28,6 +30,7 @@ def conversation(user_message):
         You are an expert in problem-solving in Mathematics.
         Based on the following extracted content, generate the most relevant answer to the user's question.
 
+        {history_block}
         User's question: "{user_message}"
 
         Relevant content:
@@ -36,6 +39,90 @@ def conversation(user_message):
         Provide a concise and helpful response.
         """
     print("The prompt is",prompt)
-    llm = ChatGoogleGenerativeAI(model="models/gemini-1.5-pro-001", google_api_key=os.getenv("GEMINI_API_KEY"))
-    ai_response = llm.predict(prompt)
-    return ai_response
\ No newline at end of file
+    return prompt
+
+def embed_query(text):
+    return get_rag_system().embed_query(text)
+
+def encode_texts(texts):
+    return get_rag_system().encode_queries(texts)
+
+async def route_message(user_message, history=""):
+    """Classify the message locally; greetings and the like never load the RAG system."""
+    loop = asyncio.get_running_loop()
+    decision = await loop.run_in_executor(None, route, user_message, embed_query, encode_texts, history)
+    print(f"Routed as {decision['intent']} ({decision['confidence']:.2f})")
+    return decision
+
+async def cached_answer(user_message, video_ids=None, playlist_id=None, start_minute=None, end_minute=None):
+    """
+    Look up a stored answer to a near-identical question about the selected videos.
+
+    Returns:
+        (answer or None, corpus version, question embedding); the last two are
+        passed back to the cache when storing a freshly generated answer.
+    """
+    loop = asyncio.get_running_loop()
+    rag = await loop.run_in_executor(None, get_rag_system)
+    # Captured before generating, so an answer built on an outdated corpus is never served
+    corpus_version = await loop.run_in_executor(
+        None, scope_corpus_version, video_ids, playlist_id, start_minute, end_minute)
+    embedding = await loop.run_in_executor(None, rag.embed_query, user_message)
+    return get_answer_cache().get(corpus_version, embedding, user_message), corpus_version, embedding
+
+async def conversation(user_message, history="", video_ids=None, playlist_id=None, start_minute=None,
+                       end_minute=None):
+    """
+    Answer a message, searching the selected videos or playlist (see `rag_main`).
+
+    Without a selection the default transcript is searched.
+    """
+    transcript_file = r"A:\Projects\Edu_Pro\backend\data\single.json"
+    decision = await route_message(user_message, history)
+    if decision["response"] is not None:
+        return decision["response"]
+    if not decision["retrieve"]:
+        # Follow-up on the previous answer: the history is the context
+        prompt = build_prompt(user_message, FOLLOWUP_CONTENT, history)
+        return await get_llm_client().generate(prompt)
+    # Messages that may lean on earlier turns are neither served from nor stored in the cache
+    answer, corpus_version, embedding = (
+        await cached_answer(user_message, video_ids, playlist_id, start_minute, end_minute)
+        if decision["cache"] else (None, None, None))
+    if answer is not None:
+        print("Serving cached answer")
+        return answer
+    content = await rag_main_async(user_message, video_ids, playlist_id, start_minute, end_minute)
+    print("The rag provided content is",content)
+    prompt = build_prompt(user_message, content, history)
+    # Shared client: no per-message construction, and the event loop stays free
+    ai_response = await get_llm_client().generate(prompt)
+    if embedding is not None:
+        get_answer_cache().set(corpus_version, embedding, ai_response, user_message)
+    return ai_response
+
+async def conversation_stream(user_message, history="", video_ids=None, playlist_id=None, start_minute=None,
+                              end_minute=None):
+    """Like conversation(), but yields the answer in chunks as Gemini generates it."""
+    decision = await route_message(user_message, history)
+    if decision["response"] is not None:
+        yield decision["response"]
+        return
+    if not decision["retrieve"]:
+        async for token in get_llm_client().stream(build_prompt(user_message, FOLLOWUP_CONTENT, history)):
+            yield token
+        return
+    answer, corpus_version, embedding = (
+        await cached_answer(user_message, video_ids, playlist_id, start_minute, end_minute)
+        if decision["cache"] else (None, None, None))
+    if answer is not None:
+        yield answer
+        return
+    content = await rag_main_async(user_message, video_ids, playlist_id, start_minute, end_minute)
+    prompt = build_prompt(user_message, content, history)
+    chunks = []
+    async for token in get_llm_client().stream(prompt):
+        chunks.append(token)
+        yield token
+    if embedding is not None:
+        get_answer_cache().set(corpus_version, embedding, "".join(chunks), user_message)
\ No newline at end of file
@@ -0,0 +1,263 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+import numpy as np
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Metadata fields stored in their own columns; everything else goes to the "extra" JSON column
+CONTENT_FIELDS = ("text", "content", "body")
+FLOAT_COLUMNS = ("start", "end", "duration")
+
+KEY_DTYPE = "S40"  # hex SHA-1
+
+
+def content_hash(text: str) -> str:
+    """Return the hash used to key embeddings by document content."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class StringColumn:
+    def __init__(self, blob: Any, offsets: np.ndarray):
+        """A column of strings stored as one UTF-8 blob plus an offset array."""
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])]).decode('utf-8')
+
+    @staticmethod
+    def write(path: str, values: Iterable[str]) -> None:
+        """Write `values` as `<path>.bin` and `<path>.offsets.npy`."""
+        offsets = [0]
+        tmp = tmp_path(path + ".bin")
+        with open(tmp, 'wb') as f:
+            for value in values:
+                data = value.encode('utf-8')
+                f.write(data)
+                offsets.append(offsets[-1] + len(data))
+        save_npy(path + ".offsets.npy", np.array(offsets, dtype='int64'))
+        os.replace(tmp, path + ".bin")
+
+    @classmethod
+    def open(cls, path: str) -> "StringColumn":
+        """Memory-map a column written by `write`."""
+        offsets = np.load(path + ".offsets.npy", mmap_mode='r')
+        with open(path + ".bin", 'rb') as f:
+            # mmap refuses empty files
+            blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b""
+        return cls(blob, offsets)
+
+
+def tmp_path(path: str) -> str:
+    """Temporary file next to `path`, unique per process and thread, for an atomic replace."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def save_npy(path: str, array: np.ndarray) -> None:
+    """Save an array atomically so readers never map a half-written file."""
+    tmp = tmp_path(path)
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+@contextmanager
+def file_lock(path: str, shared: bool = False) -> Iterator[None]:
+    """
+    Hold an advisory lock on `path` across processes, e.g. uvicorn workers sharing an index.
+
+    Shared locks admit several holders at once; on Windows every lock is exclusive.
+    Locks taken through separate calls exclude each other even within one process.
+    """
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class DocumentStore:
+    def __init__(self, columns: Optional[Dict[str, Any]] = None, rows: Optional[np.ndarray] = None,
+                 tail: Optional[List[Dict[str, Any]]] = None):
+        """
+        Columnar, memory-mapped store for RAG documents.
+
+        Persisted documents live in read-only memory-mapped columns: the content
+        as a single UTF-8 blob with an offset array, keys and content hashes as
+        fixed-width arrays, and compact metadata columns. Because the pages are
+        mapped read-only from the same files, uvicorn workers share one copy of
+        the corpus through the OS page cache instead of each holding Python dicts.
+
+        Stores are immutable: `extend` and `select` return new stores, so a search
+        holding a snapshot is never affected by concurrent ingestion. Documents
+        added since the last `save` are kept in memory until the next save.
+
+        Args:
+            columns: Memory-mapped columns from `open`, or None for an empty store.
+            rows: Persisted rows visible in this store, or None for all of them.
+            tail: Documents added since the store was last saved.
+        """
+        self._columns = columns
+        self._rows = rows
+        self._tail = tail or []
+        if columns is None:
+            self._base_len = 0
+        elif rows is None:
+            self._base_len = len(columns["keys"])
+        else:
+            self._base_len = len(rows)
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Dict[str, Any]]) -> "DocumentStore":
+        """Create an in-memory store from documents built with `make_document`."""
+        return cls(tail=list(documents))
+
+    def __len__(self) -> int:
+        return self._base_len + len(self._tail)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i >= self._base_len:
+            return self._tail[i - self._base_len]
+        row = i if self._rows is None else int(self._rows[i])
+        columns = self._columns
+
+        metadata = {}
+        extra = columns["extra"][row]
+        if extra:
+            metadata.update(json.loads(extra))
+        doc_id = columns["ids"][row]
+        if doc_id:
+            metadata["id"] = doc_id
+        for name in FLOAT_COLUMNS:
+            value = columns[name][row]
+            if not np.isnan(value):
+                metadata[name] = float(value)
+        return {
+            "key": columns["keys"][row].decode('ascii'),
+            "content": columns["texts"][row],
+            "metadata": metadata,
+        }
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def _base_column(self, name: str) -> np.ndarray:
+        column = self._columns[name]
+        return column if self._rows is None else column[self._rows]
+
+    def keys(self) -> List[str]:
+        """Return every document key without decoding the content."""
+        keys = [k.decode('ascii') for k in self._base_column("keys")] if self._columns else []
+        return keys + [doc["key"] for doc in self._tail]
+
+    def content_hashes(self) -> List[str]:
+        """Return the content hash of every document, aligned with the documents."""
+        hashes = [h.decode('ascii') for h in self._base_column("hashes")] if self._columns else []
+        return hashes + [content_hash(doc["content"]) for doc in self._tail]
+
+    def extend(self, documents: Sequence[Dict[str, Any]]) -> "DocumentStore":
+        """Return a new store with `documents` appended."""
+        return DocumentStore(self._columns, self._rows, self._tail + list(documents))
+
+    def select(self, positions: Sequence[int]) -> "DocumentStore":
+        """Return a new store holding only the documents at `positions`, in order."""
+        positions = list(positions)
+        base = [p for p in positions if p < self._base_len]
+        tail = [self._tail[p - self._base_len] for p in positions if p >= self._base_len]
+        if self._columns is None:
+            return DocumentStore(tail=tail)
+        rows = np.array(base, dtype='int64')
+        if self._rows is not None:
+            rows = np.asarray(self._rows)[rows]
+        return DocumentStore(self._columns, rows, tail)
+
+    def save(self, directory: str) -> "DocumentStore":
+        """
+        Write every document to `directory` and return a memory-mapped store over it.
+
+        Args:
+            directory: Directory for the column files, created if needed.
+
+        Returns:
+            A store reading from the files just written.
+        """
+        os.makedirs(directory, exist_ok=True)
+        count = len(self)
+        floats = {name: np.full(count, np.nan) for name in FLOAT_COLUMNS}
+        ids, extras = [], []
+        for i, doc in enumerate(self):
+            metadata = doc["metadata"]
+            ids.append(str(metadata.get("id", "")))
+            for name in FLOAT_COLUMNS:
+                if name in metadata:
+                    floats[name][i] = float(metadata[name])
+            # Content fields are dropped: the text is already in the texts column
+            extra = {k: v for k, v in metadata.items()
+                     if k not in CONTENT_FIELDS and k != "id" and k not in FLOAT_COLUMNS}
+            extras.append(json.dumps(extra, ensure_ascii=False) if extra else "")
+
+        StringColumn.write(os.path.join(directory, "texts"), (doc["content"] for doc in self))
+        StringColumn.write(os.path.join(directory, "ids"), ids)
+        StringColumn.write(os.path.join(directory, "extra"), extras)
+        save_npy(os.path.join(directory, "keys.npy"), np.array(self.keys(), dtype=KEY_DTYPE))
+        save_npy(os.path.join(directory, "hashes.npy"), np.array(self.content_hashes(), dtype=KEY_DTYPE))
+        for name, values in floats.items():
+            save_npy(os.path.join(directory, f"{name}.npy"), values)
+        return DocumentStore.open(directory)
+
+    @classmethod
+    def open(cls, directory: str) -> "DocumentStore":
+        """Memory-map a store written by `save`."""
+        columns = {
+            "texts": StringColumn.open(os.path.join(directory, "texts")),
+            "ids": StringColumn.open(os.path.join(directory, "ids")),
+            "extra": StringColumn.open(os.path.join(directory, "extra")),
+            "keys": np.load(os.path.join(directory, "keys.npy"), mmap_mode='r'),
+            "hashes": np.load(os.path.join(directory, "hashes.npy"), mmap_mode='r'),
+        }
+        for name in FLOAT_COLUMNS:
+            columns[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+        return cls(columns)
+
+    def nbytes(self) -> int:
+        """Approximate bytes on disk/in page cache for the persisted part of the store."""
+        if self._columns is None:
+            return 0
+        total = 0
+        for column in self._columns.values():
+            if isinstance(column, StringColumn):
+                total += len(column.blob) + column.offsets.nbytes
+            else:
+                total += column.nbytes
+        return total
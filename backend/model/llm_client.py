@@ -0,0 +1,92 @@
+import asyncio
+import os
+import threading
+from typing import AsyncIterator, Optional
+from dotenv import load_dotenv
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+load_dotenv()
+
+LLM_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-1.5-pro-001")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+
+_client: Optional["LLMClient"] = None
+_client_lock = threading.Lock()
+
+
+class LLMClient:
+    def __init__(self, model: str = LLM_MODEL, api_key: Optional[str] = None, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, max_concurrency: int = LLM_MAX_CONCURRENCY):
+        """
+        Long-lived async wrapper around the Gemini chat model.
+
+        The underlying client (and its connection) is created once and reused
+        for every request. At most `max_concurrency` generations run at once per
+        process; further requests wait for a slot instead of piling onto the API.
+
+        Args:
+            model: Gemini model name.
+            api_key: Gemini API key, defaults to GEMINI_API_KEY.
+            timeout: Seconds before a generation is abandoned.
+            max_retries: Retries on transient API errors.
+            max_concurrency: Maximum number of in-flight generations.
+        """
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.llm = ChatGoogleGenerativeAI(
+            model=model,
+            google_api_key=api_key or os.getenv("GEMINI_API_KEY"),
+            timeout=timeout,
+            max_retries=max_retries,
+        )
+        self._semaphore = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created on first use so it belongs to the server's event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def generate(self, prompt: str) -> str:
+        """
+        Generate a response for `prompt` without blocking the event loop.
+
+        Raises:
+            asyncio.TimeoutError: If the model does not answer within the timeout.
+        """
+        async with self.semaphore:
+            response = await asyncio.wait_for(self.llm.ainvoke(prompt), self.timeout)
+        return response.content
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Yield the response to `prompt` chunk by chunk as Gemini produces it.
+
+        The timeout applies to the wait for each chunk, so long answers are not
+        cut off as long as tokens keep arriving.
+
+        Raises:
+            asyncio.TimeoutError: If no chunk arrives within the timeout.
+        """
+        async with self.semaphore:
+            chunks = self.llm.astream(prompt).__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                if chunk.content:
+                    yield chunk.content
+
+
+def get_llm_client() -> LLMClient:
+    """Return the process-wide LLM client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
@@ -0,0 +1,167 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from model.chat_store import ChatStore, MAX_PAGE_SIZE, get_chat_store, pending_turns
+from model.chunker import count_tokens, truncate_tokens
+from model.llm_client import LLMClient, get_llm_client
+
+# Tokens of history (summary plus verbatim turns) allowed in one prompt
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1200"))
+# Share of the budget the rolling summary may take
+SUMMARY_TOKEN_BUDGET = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+# Older turns are folded into the summary once they add up to this many tokens
+FOLD_MIN_TOKENS = int(os.getenv("MEMORY_FOLD_MIN_TOKENS", "400"))
+# Most recent turns considered for verbatim replay
+RECENT_TURNS = min(int(os.getenv("MEMORY_RECENT_TURNS", "20")), MAX_PAGE_SIZE)
+
+_memory: Optional["ConversationMemory"] = None
+
+
+def turn_tokens(message: Dict[str, Any]) -> int:
+    return count_tokens(message["human"]) + count_tokens(message["AI"]) + 4
+
+
+def turn_key(message: Dict[str, Any]) -> Tuple[str, str, datetime]:
+    """Identify a turn both before and after storing; MongoDB keeps timestamps to the millisecond."""
+    timestamp = message["timestamp"]
+    return message["human"], message["AI"], timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+
+
+def format_turns(messages: List[Dict[str, Any]]) -> str:
+    return "\n".join(f"Student: {m['human']}\nTutor: {m['AI']}" for m in messages)
+
+
+class ConversationMemory:
+    def __init__(self, store: Optional[ChatStore] = None, llm: Optional[LLMClient] = None,
+                 token_budget: int = MEMORY_TOKEN_BUDGET, summary_budget: int = SUMMARY_TOKEN_BUDGET,
+                 fold_min_tokens: int = FOLD_MIN_TOKENS, recent_turns: int = RECENT_TURNS):
+        """
+        Prompt history for a chat under a fixed token budget.
+
+        The newest turns are replayed verbatim for as long as they fit next to
+        the rolling summary; everything older is folded into that summary, which
+        is stored on the chat's session document. Folding needs an LLM call, so
+        it runs after a turn has been answered (see `schedule_update`) and only
+        once enough overflow has accumulated, never on the answering path.
+
+        Args:
+            store: Chat store, defaults to the process-wide one.
+            llm: LLM client used for summarizing, defaults to the process-wide one.
+            token_budget: Maximum tokens of history in a prompt.
+            summary_budget: Maximum tokens of the rolling summary.
+            fold_min_tokens: Overflow tokens needed before a fold is run.
+            recent_turns: Most recent turns read for verbatim replay.
+        """
+        self._store = store
+        self._llm = llm
+        self.token_budget = token_budget
+        self.summary_budget = min(summary_budget, token_budget)
+        self.fold_min_tokens = fold_min_tokens
+        self.recent_turns = recent_turns
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def store(self) -> ChatStore:
+        return self._store or get_chat_store()
+
+    @property
+    def llm(self) -> LLMClient:
+        return self._llm or get_llm_client()
+
+    async def _window(self, chat_name: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Return the stored summary and the newest unsummarized turns that fit the budget.
+
+        Turns still waiting in the write-behind buffer are newer than any stored
+        turn and are included; a batch being written may be in both, so stored
+        copies are skipped.
+        """
+        summary = await self.store.get_summary(chat_name)
+        page = await self.store.get_messages(chat_name, limit=self.recent_turns)
+        stored = {turn_key(m) for m in page["messages"]}
+        messages = page["messages"] + [m for m in pending_turns(chat_name) if turn_key(m) not in stored]
+        until = summary["summarized_until"]
+        budget = self.token_budget - count_tokens(summary["summary"])
+        recent: List[Dict[str, Any]] = []
+        for message in reversed(messages[-self.recent_turns:]):
+            if until is not None and message["timestamp"] <= until:
+                break
+            budget -= turn_tokens(message)
+            if budget < 0:
+                break
+            recent.insert(0, message)
+        return summary, recent
+
+    async def build_history(self, chat_name: str) -> str:
+        """
+        Return the chat's history formatted for a prompt, within the token budget.
+
+        Returns:
+            The rolling summary followed by the recent turns, or "" for a new chat.
+        """
+        summary, recent = await self._window(chat_name)
+        parts = []
+        if summary["summary"]:
+            parts.append(f"Summary of the earlier conversation:\n{summary['summary']}")
+        if recent:
+            parts.append(f"Recent conversation:\n{format_turns(recent)}")
+        return "\n\n".join(parts)
+
+    async def update(self, chat_name: str) -> bool:
+        """
+        Fold turns that no longer fit the verbatim window into the rolling summary.
+
+        Returns:
+            True if the summary was updated.
+        """
+        lock = self._locks.setdefault(chat_name, asyncio.Lock())
+        async with lock:
+            summary, recent = await self._window(chat_name)
+            until = summary["summarized_until"]
+            # Oldest unsummarized turns first; a long backlog is folded over several updates
+            page = await self.store.get_messages(chat_name, limit=MAX_PAGE_SIZE, after=until or datetime.min)
+            pending = page["messages"]
+            boundary = recent[0]["timestamp"] if recent else None
+            overflow = [m for m in pending if boundary is None or m["timestamp"] < boundary]
+            if not overflow or sum(turn_tokens(m) for m in overflow) < self.fold_min_tokens:
+                return False
+
+            prompt = f"""
+            You maintain a running summary of a tutoring conversation about Mathematics.
+            Update the summary with the new exchanges below. Keep the topics covered,
+            what the student struggled with, definitions and results they were given,
+            and any open questions. Use at most {self.summary_budget * 3 // 4} words.
+
+            Current summary:
+            {summary["summary"] or "(none)"}
+
+            New exchanges:
+            {format_turns(overflow)}
+            """
+            new_summary = truncate_tokens((await self.llm.generate(prompt)).strip(), self.summary_budget)
+            stored = await self.store.set_summary(chat_name, new_summary, overflow[-1]["timestamp"], until)
+            if stored:
+                print(f"✅ Folded {len(overflow)} turns of {chat_name} into its summary")
+            return stored
+
+    def schedule_update(self, chat_name: str) -> None:
+        """Run `update` in the background so the answer is not delayed by summarization."""
+        task = asyncio.get_running_loop().create_task(self._update_quietly(chat_name))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _update_quietly(self, chat_name: str) -> None:
+        try:
+            await self.update(chat_name)
+        except Exception as e:
+            print(f"❌ Error updating conversation summary for {chat_name}: {e}")
+
+
+def get_memory() -> ConversationMemory:
+    """Return the process-wide conversation memory."""
+    global _memory
+    if _memory is None:
+        _memory = ConversationMemory()
+    return _memory
@@ -1,138 +1,1088 @@
+import asyncio
+import hashlib
 import json
+import math
+import os
+import pickle
+import shutil
+import threading
+import time
 import numpy as np
+from contextlib import contextmanager, nullcontext
 import faiss
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict, Any
+from typing import List, Dict, Any, ContextManager, Hashable, Iterable, Iterator, Optional, Tuple
+from model.bm25 import BM25Index, is_symbolic_query, reciprocal_rank_fusion
+from model.cache import LRUCache
+from model.chunker import chunk_segments, is_timed_transcript, transcript_segments
+from model.context import CONTEXT_CANDIDATES, assemble_context
+from model.docstore import CONTENT_FIELDS, DocumentStore, content_hash, file_lock, save_npy, tmp_path
+from model.shards import DATA_DIR, list_shards, shard_exists, shard_index_dir, shard_source_path
+
+DEFAULT_JSON_PATH = os.path.join(DATA_DIR, "single.json")
+DEFAULT_INDEX_DIR = os.path.join(DATA_DIR, "rag_index")
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Index types, picked by corpus size when index_type is "auto"
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+# Exact search over 100k 384-dim vectors still takes only ~20 ms, so approximate indexes start beyond that
+AUTO_FLAT_MAX = 100_000
+AUTO_HNSW_MAX = 200_000
+AUTO_IVF_MAX = 1_000_000
+
+# Vector compression: "none" keeps float32, "fp16"/"int8" use FAISS scalar quantizers
+QUANTIZATIONS = ("none", "fp16", "int8")
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# Candidate list per query: in benchmark_rag.py, 64 gave recall@5 of 0.66 at 25k vectors, 512 gives 0.86 at 100k
+HNSW_EF_SEARCH = 512
+IVF_TRAINING_POINTS_PER_LIST = 64
+PQ_BITS = 8
+
+# Query embedding and search result caches
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL = float(os.getenv("RAG_QUERY_CACHE_TTL", "3600"))
+# Batches ingested between saves, so other processes can search a stream as it grows
+INGEST_SAVE_EVERY = int(os.getenv("RAG_INGEST_SAVE_EVERY", "4"))
+
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.faiss"
+EMBEDDINGS_FILE = "embeddings.npy"
+DOCUMENTS_DIR = "documents"
+LEXICAL_FILE = "lexical.pkl"
+# Every save goes to a new generation directory that the manifest then points to
+GENERATION_PREFIX = "gen-"
+LOCK_FILE = "index.lock"
+
+# Retrieval modes: dense (FAISS), lexical (BM25), hybrid (both, fused), or auto
+SEARCH_MODES = ("dense", "lexical", "hybrid", "auto")
+DEFAULT_SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "auto")
+HYBRID_CANDIDATES = 20
+
+# Sentence-transformer models are shared by every RAGSystem in the process.
+_encoders: Dict[str, SentenceTransformer] = {}
+_encoders_lock = threading.Lock()
+
+# Process-wide RAG systems, keyed by source JSON path.
+_rag_systems: Dict[str, "RAGSystem"] = {}
+# One lock per path, so building or syncing one shard never blocks lookups of another
+_rag_system_locks: Dict[str, threading.Lock] = {}
+_rag_systems_lock = threading.Lock()
+
+# Async micro-batcher in front of the default RAG system
+_query_batcher: Optional["QueryBatcher"] = None
+
+
+def get_encoder(model_name: str = DEFAULT_MODEL_NAME) -> SentenceTransformer:
+    """Return the process-wide encoder for `model_name`, loading it on first use."""
+    with _encoders_lock:
+        if model_name not in _encoders:
+            print(f"Loading sentence-transformer model {model_name}...")
+            _encoders[model_name] = SentenceTransformer(model_name)
+        return _encoders[model_name]
+
+
+def normalize_query(query: str) -> str:
+    """Normalize query text for cache lookups (the MiniLM encoder is uncased)."""
+    return " ".join(query.lower().split())
+
+
+def document_minutes(metadata: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """
+    Return the first and last transcript minute a document covers, if known.
+
+    Chunks and captions carry `start`/`end` in seconds; minute-grouped
+    transcripts from `group_transcript_by_minute` are keyed by the minute index.
+    """
+    if "start" in metadata:
+        first = int(float(metadata["start"]) // 60)
+        end = metadata.get("end")
+        last = max(first, math.ceil(float(end) / 60) - 1) if end is not None else first
+        return first, last
+    try:
+        minute = int(metadata.get("id"))
+        return minute, minute
+    except (TypeError, ValueError):
+        return None
+
+
+def matches_filters(metadata: Dict[str, Any], video_ids: Optional[set] = None,
+                    start_minute: Optional[int] = None, end_minute: Optional[int] = None) -> bool:
+    """
+    Check a document against video and time-range filters.
+
+    The video filter only applies to documents tagged with a `video_id`
+    (playlist shards); per-video shards are selected by shard instead.
+    A document matches the inclusive time range if any minute it covers falls
+    inside it; documents with no known minute never match a time filter.
+    """
+    if video_ids and "video_id" in metadata and metadata["video_id"] not in video_ids:
+        return False
+    if start_minute is None and end_minute is None:
+        return True
+    minutes = document_minutes(metadata)
+    if minutes is None:
+        return False
+    first, last = minutes
+    if start_minute is not None and last < start_minute:
+        return False
+    if end_minute is not None and first > end_minute:
+        return False
+    return True
+
+
+def make_document(content: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build a document dict with a stable key derived from its content and metadata.
+
+    Two caption lines with the same text but different timestamps get different
+    keys, while still sharing one embedding through their content hash. The
+    content is not repeated in the stored metadata.
+    """
+    metadata = metadata or {}
+    payload = json.dumps([content, metadata], sort_keys=True, ensure_ascii=False, default=str)
+    return {
+        "key": hashlib.sha1(payload.encode('utf-8')).hexdigest(),
+        "content": content,
+        "metadata": {k: v for k, v in metadata.items() if k not in CONTENT_FIELDS},
+    }
+
+
+def chunk_documents(chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Turn chunks from `chunk_segments` into documents, keeping their timing as metadata."""
+    for chunk in chunks:
+        yield make_document(chunk["text"], {k: v for k, v in chunk.items() if k != "text"})
+
+
+def parse_documents(data: Any) -> List[Dict[str, Any]]:
+    """
+    Turn the transcript JSON (a list of captions or a dict of minutes) into documents.
+
+    Timed transcripts are re-chunked into token-bounded, overlapping windows;
+    other JSON is indexed one document per item.
+    """
+    if is_timed_transcript(data):
+        return list(chunk_documents(chunk_segments(transcript_segments(data))))
+
+    documents = []
+
+    if isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict):
+                content = item.get("text") or item.get("content") or item.get("body") or None
+                if content:
+                    documents.append(make_document(content, item))
+            elif isinstance(item, str):
+                documents.append(make_document(item))
+
+    elif isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, str):
+                documents.append(make_document(value, {"id": key}))
+            elif isinstance(value, dict):
+                content = value.get("text") or value.get("content") or value.get("body") or None
+                if content:
+                    documents.append(make_document(content, value))
+
+    return documents
+
+
+def select_index_type(num_vectors: int, index_type: str = "auto") -> str:
+    """
+    Resolve `index_type` to a concrete FAISS index type.
+
+    "auto" uses an exact flat index for small corpora, HNSW up to a few hundred
+    thousand vectors, IVF beyond that and IVF-PQ once raw vectors no longer fit
+    comfortably in memory. Types that cannot be trained on `num_vectors` fall
+    back to the next simpler one.
+    """
+    if index_type == "auto":
+        if num_vectors < AUTO_FLAT_MAX:
+            index_type = "flat"
+        elif num_vectors < AUTO_HNSW_MAX:
+            index_type = "hnsw"
+        elif num_vectors < AUTO_IVF_MAX:
+            index_type = "ivf"
+        else:
+            index_type = "ivfpq"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}, expected 'auto' or one of {INDEX_TYPES}")
+
+    # IVF needs enough points to train its coarse quantizer, PQ its codebooks
+    if index_type == "ivfpq" and num_vectors < (1 << PQ_BITS) * 39:
+        index_type = "ivf"
+    if index_type == "ivf" and num_vectors < 39 * 16:
+        index_type = "flat"
+    return index_type
+
+
+def _ivf_nlist(num_vectors: int) -> int:
+    """Number of IVF inverted lists: about 4*sqrt(n), with at least 39 training points per list."""
+    return int(max(16, min(4 * np.sqrt(num_vectors), num_vectors // 39)))
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    """Largest PQ sub-quantizer count dividing `dimension` with at least 4 dims each."""
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dimension % m == 0 and dimension // m >= 4:
+            return m
+    return 1
+
+
+def configure_search(index: faiss.Index, nprobe: Optional[int] = None, ef_search: int = HNSW_EF_SEARCH) -> None:
+    """Set query-time parameters (IVF nprobe, HNSW efSearch) on `index`."""
+    if hasattr(index, "nlist"):
+        faiss.extract_index_ivf(index).nprobe = nprobe or max(1, index.nlist // 16)
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+def create_faiss_index(embeddings: np.ndarray, index_type: str = "auto", quantization: str = "none") -> faiss.Index:
+    """
+    Create a FAISS index of `index_type` holding `embeddings`, training it if needed.
+
+    With `quantization` set to "fp16" or "int8", flat, HNSW and IVF indexes store
+    scalar-quantized vectors (2 or 1 bytes per dimension instead of 4). IVF-PQ
+    already stores compressed codes and ignores it.
+
+    Args:
+        embeddings: Normalized vectors, one row per document.
+        index_type: "auto" or one of INDEX_TYPES.
+        quantization: One of QUANTIZATIONS.
+
+    Returns:
+        The populated index, with search parameters configured.
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    num_vectors, dimension = embeddings.shape
+    index_type = select_index_type(num_vectors, index_type)
+    sq_type = _SQ_TYPES.get(quantization)
+    nlist = 0
+
+    if index_type == "flat":
+        if sq_type is None:
+            index = faiss.IndexFlatL2(dimension)  # Using L2 distance
+        else:
+            index = faiss.IndexScalarQuantizer(dimension, sq_type, faiss.METRIC_L2)
+    elif index_type == "hnsw":
+        if sq_type is None:
+            index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        else:
+            index = faiss.IndexHNSWSQ(dimension, sq_type, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    else:
+        nlist = _ivf_nlist(num_vectors)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivfpq":
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), PQ_BITS)
+        elif sq_type is None:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, sq_type, faiss.METRIC_L2)
+
+    if not index.is_trained:
+        # Train on a random sample, more points add build time without helping recall
+        sample_size = min(num_vectors, max(nlist * IVF_TRAINING_POINTS_PER_LIST, (1 << PQ_BITS) * 39))
+        sample = embeddings[np.random.default_rng(0).choice(num_vectors, sample_size, replace=False)]
+        index.train(sample)
+
+    index.add(embeddings)
+    configure_search(index)
+    return index
+
+
+def index_nbytes(index: faiss.Index) -> int:
+    """Return the serialized size of a FAISS index, a close proxy for its memory use."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def file_hash(path: str) -> Optional[str]:
+    """Return the SHA-256 hex digest of a file, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
 
 class RAGSystem:
-    def __init__(self, json_path: str, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, json_path: str, model_name: str = DEFAULT_MODEL_NAME,
+                 index_dir: Optional[str] = None, index_type: str = "auto", quantization: str = "none"):
         """
         Initialize the RAG system with a JSON file and embedding model.
-        
+
+        When `index_dir` is given, a previously persisted index built with the same
+        model is reused and brought up to date with the JSON file; otherwise the
+        index is built from the JSON file and written to `index_dir`. Processes
+        sharing `index_dir` coordinate through a lock file in it (see `load_index`).
+
         Args:
             json_path: Path to the JSON file containing the text data.
             model_name: Name of the sentence-transformer model to use.
+            index_dir: Directory holding the persisted index, or None to keep it in memory only.
+            index_type: "auto" to pick the FAISS index by corpus size, or one of INDEX_TYPES.
+            quantization: "none" for float32 vectors, or "fp16"/"int8" to store them compressed.
         """
         self.json_path = json_path
-        self.encoder = SentenceTransformer(model_name)
-        self.documents = []
+        self.model_name = model_name
+        self.index_dir = index_dir
+        self.index_type = index_type
+        self.active_index_type = None
+        self.quantization = quantization
+        self.active_quantization = None
+        # Raw vectors kept for rebuilds are stored at half precision when quantizing
+        self.embedding_dtype = 'float32' if quantization == "none" else 'float16'
+        self.documents = DocumentStore()
         self.document_embeddings = None
         self.index = None
-        
-        # Load and process the JSON data
-        self.load_data()
-        self.build_index()
-        
-    def load_data(self) -> None:
-        """Load and process the JSON data."""
+        self.lexical_index = BM25Index()
+        self.source_hash = None
+        self.source_mtime = None
+        # Persisted generation the in-memory index matches, see `save_index`
+        self.generation = None
+        # Embeddings keyed by content hash, so unchanged text is never re-encoded
+        self.embedding_store: Dict[str, np.ndarray] = {}
+        self._document_keys = set()
+        self._lock = threading.RLock()
+        # Whether this thread holds the index_dir file lock; taken before self._lock
+        self._persist_lock_state = threading.local()
+        # Bumped on every index change; part of the result cache key
+        self.index_version = 0
+        self.query_embedding_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self.result_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+        if index_dir:
+            self.load_index()
+        else:
+            # Load and process the JSON data
+            self.load_data()
+            self.build_index()
+
+    @property
+    def encoder(self) -> SentenceTransformer:
+        """The sentence-transformer, loaded lazily so disk reloads stay cheap."""
+        return get_encoder(self.model_name)
+
+    def _persist_lock(self, shared: bool = False) -> ContextManager[None]:
+        """
+        Lock `index_dir` against other processes; reentrant within a thread.
+
+        Readers take it shared, so they never load a half-written index; saves,
+        rebuilds and syncs take it exclusively. Without `index_dir` it is a no-op.
+        """
+        if not self.index_dir or getattr(self._persist_lock_state, "held", False):
+            return nullcontext()
+        return self._hold_persist_lock(shared)
+
+    @contextmanager
+    def _hold_persist_lock(self, shared: bool) -> Iterator[None]:
+        os.makedirs(self.index_dir, exist_ok=True)
+        with file_lock(os.path.join(self.index_dir, LOCK_FILE), shared):
+            self._persist_lock_state.held = True
+            try:
+                yield
+            finally:
+                self._persist_lock_state.held = False
+
+    def _index_changed(self) -> None:
+        """Invalidate cached search results after the index changed."""
+        self.index_version += 1
+        self.result_cache.clear()
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return hit/miss counters for the query embedding and result caches."""
+        return {
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "results": self.result_cache.stats(),
+        }
+
+    @property
+    def corpus_version(self) -> Tuple[str, int]:
+        """Identify the current contents of the index; changes whenever documents change."""
+        return (self.json_path, self.index_version)
+
+    def encode_queries(self, texts: List[str]) -> np.ndarray:
+        """Return normalized float32 embeddings of `texts`, bypassing the caches."""
+        embeddings = np.array(self.encoder.encode(texts), dtype='float32')
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Return the normalized embedding of `query`, shared with the search query cache."""
+        normalized = normalize_query(query)
+        embedding = self.query_embedding_cache.get(normalized)
+        if embedding is None:
+            embedding = self.encode_queries([query])[0]
+            self.query_embedding_cache.set(normalized, embedding)
+        return embedding
+
+    def read_source(self) -> Optional[List[Dict[str, Any]]]:
+        """Read the JSON file and return its documents, or None if it cannot be read."""
         try:
+            self.source_mtime = os.path.getmtime(self.json_path)
+            self.source_hash = file_hash(self.json_path)
             with open(self.json_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
+            return parse_documents(data)
 
-            self.documents = []  # Reset documents list
+        except Exception as e:
+            print(f"Error loading data: {e}")
+            return None
 
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict):
-                        content = item.get("text") or item.get("content") or item.get("body") or None
-                        if content:  
-                            self.documents.append({"content": content, "metadata": item})
-                    elif isinstance(item, str):
-                        self.documents.append({"content": item, "metadata": {}})
+    def load_data(self) -> None:
+        """Load and process the JSON data."""
+        self.documents = DocumentStore.from_documents(self.read_source() or [])
+        print(f"Loaded {len(self.documents)} documents from {self.json_path}")
 
-            elif isinstance(data, dict):
-                for key, value in data.items():
-                    if isinstance(value, str):
-                        self.documents.append({"content": value, "metadata": {"id": key}})
-                    elif isinstance(value, dict):
-                        content = value.get("text") or value.get("content") or value.get("body") or None
-                        if content:
-                            self.documents.append({"content": content, "metadata": value})
+    def embed_documents(self, documents: Iterable[Dict[str, Any]]) -> np.ndarray:
+        """
+        Return normalized embeddings for `documents`, encoding only unseen content.
 
-            print(f"Loaded {len(self.documents)} documents from {self.json_path}")
+        Args:
+            documents: Documents built with `make_document`.
+
+        Returns:
+            An array with one row per document, in the storage dtype (float16 when quantizing).
+        """
+        if isinstance(documents, DocumentStore):
+            documents = list(documents)
+        hashes = [content_hash(doc["content"]) for doc in documents]
+        missing = {}
+        for h, doc in zip(hashes, documents):
+            if h not in self.embedding_store and h not in missing:
+                missing[h] = doc["content"]
+
+        if missing:
+            # Generate embeddings for new content only
+            embeddings = self.encoder.encode(list(missing.values()), show_progress_bar=len(missing) > 100)
+            embeddings = np.array(embeddings).astype('float32')
+            faiss.normalize_L2(embeddings)  # Normalize vectors
+            for h, embedding in zip(missing, embeddings.astype(self.embedding_dtype)):
+                self.embedding_store[h] = embedding
+            print(f"Encoded {len(missing)} new chunks ({len(hashes) - len(missing)} reused)")
+
+        return np.array([self.embedding_store[h] for h in hashes], dtype=self.embedding_dtype)
+
+    def _create_index(self, embeddings: np.ndarray) -> faiss.Index:
+        """Create a FAISS index holding `embeddings`, using the configured index type and quantization."""
+        self.active_index_type = select_index_type(len(embeddings), self.index_type)
+        self.active_quantization = self.quantization
+        return create_faiss_index(embeddings, self.active_index_type, self.quantization)
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Return the bytes used by the FAISS index, the raw embeddings and the document store."""
+        return {
+            "index_bytes": index_nbytes(self.index) if self.index is not None else 0,
+            "embeddings_bytes": int(self.document_embeddings.nbytes) if self.document_embeddings is not None else 0,
+            "documents_bytes": self.documents.nbytes(),
+        }
 
-        except Exception as e:
-            print(f"Error loading data: {e}")
-            self.documents = []
-    
     def build_index(self) -> None:
         """Create FAISS index from document embeddings."""
         if not self.documents:
             print("No documents to index")
             return
-        
-        # Extract texts for encoding
-        texts = [doc["content"] for doc in self.documents]
-        
-        # Generate embeddings
-        self.document_embeddings = self.encoder.encode(texts, show_progress_bar=True)
-        
-        # Convert to float32 (required by FAISS)
-        self.document_embeddings = np.array(self.document_embeddings).astype('float32')
-        
-        # Create and train the FAISS index
-        dimension = self.document_embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)  # Using L2 distance
-        faiss.normalize_L2(self.document_embeddings)  # Normalize vectors
-        self.index.add(self.document_embeddings)
-        
-        print(f"Created FAISS index with {self.index.ntotal} vectors of dimension {dimension}")
-    
-    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+
+        with self._lock:
+            self.document_embeddings = self.embed_documents(self.documents)
+            self.index = self._create_index(self.document_embeddings)
+            self.lexical_index = BM25Index.from_texts(doc["content"] for doc in self.documents)
+            self._document_keys = set(self.documents.keys())
+            self._index_changed()
+
+        print(f"Created {self.active_index_type} FAISS index with {self.index.ntotal} vectors "
+              f"of dimension {self.document_embeddings.shape[1]}")
+
+    def add_documents(self, documents: Iterable[Dict[str, Any]]) -> int:
+        """
+        Encode and append documents that are not indexed yet.
+
+        Args:
+            documents: Documents built with `make_document`; already indexed keys are skipped.
+
+        Returns:
+            The number of documents added.
+        """
+        with self._lock:
+            new_documents, new_keys = [], set()
+            for doc in documents:
+                if doc["key"] not in self._document_keys and doc["key"] not in new_keys:
+                    new_keys.add(doc["key"])
+                    new_documents.append(doc)
+            if not new_documents:
+                return 0
+
+            embeddings = self.embed_documents(new_documents)
+            if self.index is None:
+                document_embeddings = embeddings
+                index = self._create_index(embeddings)
+            else:
+                document_embeddings = np.vstack([self.document_embeddings, embeddings])
+                if select_index_type(len(document_embeddings), self.index_type) != self.active_index_type:
+                    # The corpus outgrew the current index type, rebuild from stored vectors
+                    index = self._create_index(document_embeddings)
+                else:
+                    # Searches run on their snapshot outside the lock and FAISS does not
+                    # allow adding during a search, so add to a copy and swap it in
+                    index = faiss.clone_index(self.index)
+                    index.add(embeddings.astype('float32'))
+            self.documents = self.documents.extend(new_documents)
+            self.document_embeddings = document_embeddings
+            self.index = index
+            self.lexical_index.add(doc["content"] for doc in new_documents)
+            # Keys are only recorded once the documents are indexed, so a failed batch is retried
+            self._document_keys.update(new_keys)
+            self._index_changed()
+
+        print(f"Added {len(new_documents)} documents, index now holds {self.index.ntotal} vectors")
+        return len(new_documents)
+
+    def remove_documents(self, keys: Iterable[str]) -> int:
+        """
+        Remove documents by key and rebuild the index from the stored embeddings.
+
+        Nothing is re-encoded; only the FAISS index is rebuilt from the remaining vectors.
+
+        Args:
+            keys: Keys of the documents to remove.
+
+        Returns:
+            The number of documents removed.
+        """
+        keys = set(keys)
+        with self._lock:
+            keep = [i for i, key in enumerate(self.documents.keys()) if key not in keys]
+            removed = len(self.documents) - len(keep)
+            if not removed:
+                return 0
+
+            documents = self.documents.select(keep)
+            embeddings = self.document_embeddings[keep]
+            # An empty index rather than None, so the empty state is saved and survives a reload
+            index = self._create_index(embeddings)
+            lexical_index = BM25Index.from_texts(doc["content"] for doc in documents)
+            self.index, self.documents, self.document_embeddings = index, documents, embeddings
+            self.lexical_index = lexical_index
+            self._document_keys = set(documents.keys())
+            self._index_changed()
+
+            live_hashes = set(documents.content_hashes())
+            self.embedding_store = {h: e for h, e in self.embedding_store.items() if h in live_hashes}
+
+        print(f"Removed {removed} documents, index now holds {len(self.documents)} vectors")
+        return removed
+
+    def ingest(self, segments: Iterable[Dict[str, Any]], batch_size: int = 64,
+               save_every: int = INGEST_SAVE_EVERY) -> int:
+        """
+        Chunk a stream of transcript segments and index them as they arrive.
+
+        Windows are added to the index every `batch_size` chunks, so they become
+        searchable in this process before the stream ends. With `index_dir`,
+        the index is also saved every `save_every` batches, so other processes
+        (e.g. the API workers) can search it too.
+
+        Args:
+            segments: Dicts with `text`, `start` and `end`, e.g. from `transcript_segments`.
+            batch_size: Number of chunks encoded and added per batch.
+            save_every: Batches added between saves; the index is always saved at the end.
+
+        Returns:
+            The number of documents added.
+        """
+        added, batch, unsaved = 0, [], 0
+        for document in chunk_documents(chunk_segments(segments)):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                added += self.add_documents(batch)
+                batch = []
+                unsaved += 1
+                if self.index_dir and unsaved >= save_every:
+                    self.save_index()
+                    unsaved = 0
+        if batch:
+            added += self.add_documents(batch)
+            unsaved += 1
+        if added and unsaved and self.index_dir:
+            self.save_index()
+        return added
+
+    def sync_from_source(self) -> Tuple[int, int]:
+        """
+        Bring the index in line with the JSON file, re-embedding only new or changed chunks.
+
+        Returns:
+            A tuple of (documents added, documents removed).
+        """
+        with self._persist_lock(), self._lock:
+            source_hash = file_hash(self.json_path)
+            manifest = self._read_manifest() or {}
+            synced_elsewhere = (source_hash is not None and source_hash != self.source_hash
+                                and manifest.get("source_hash") == source_hash)
+            # A video still streaming has no source file yet, only the batches its ingesting process saved
+            streamed_elsewhere = source_hash is None and manifest.get("generation") != self.generation
+            if manifest and (synced_elsewhere or streamed_elsewhere) and self._read_index():
+                if source_hash is None:
+                    return 0, 0
+                # Another process already brought the shared index up to date
+                self.source_mtime = os.path.getmtime(self.json_path)
+                return 0, 0
+            documents = self.read_source()
+            if documents is None:
+                # Keep serving the current index rather than wiping it
+                return 0, 0
+            source_keys = {doc["key"] for doc in documents}
+            removed = self.remove_documents(self._document_keys - source_keys)
+            added = self.add_documents(documents)
+            if self.index_dir and (added or removed):
+                self.save_index()
+        print(f"Synced {self.json_path}: {added} added, {removed} removed")
+        return added, removed
+
+    def save_index(self) -> None:
+        """
+        Persist the FAISS index, embeddings and documents to `index_dir`.
+
+        Each save writes a new generation directory and then switches the
+        manifest to it, under the exclusive lock on `index_dir`. Files that
+        may still be memory-mapped are never replaced in place, which Windows
+        refuses, and an interrupted save leaves the previous generation in use.
+        Older generations are removed once nothing maps them any more.
+        """
+        if not self.index_dir or self.index is None:
+            return
+        with self._persist_lock():
+            generation = f"{GENERATION_PREFIX}{time.time_ns()}-{os.getpid()}"
+            generation_dir = os.path.join(self.index_dir, generation)
+            os.makedirs(generation_dir)
+
+            faiss.write_index(self.index, os.path.join(generation_dir, INDEX_FILE))
+            save_npy(os.path.join(generation_dir, EMBEDDINGS_FILE), self.document_embeddings)
+            with open(os.path.join(generation_dir, LEXICAL_FILE), 'wb') as f:
+                pickle.dump(self.lexical_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            with self._lock:
+                # Swap in the memory-mapped store so newly added documents leave the heap
+                self.documents = self.documents.save(os.path.join(generation_dir, DOCUMENTS_DIR))
+
+            manifest = {
+                "source_path": self.json_path,
+                "source_hash": self.source_hash,
+                "model_name": self.model_name,
+                "generation": generation,
+                "num_documents": len(self.documents),
+                "dimension": int(self.document_embeddings.shape[1]),
+                "index_type": self.active_index_type,
+                "quantization": self.active_quantization,
+                "created_at": time.time(),
+            }
+            manifest_path = os.path.join(self.index_dir, MANIFEST_FILE)
+            tmp = tmp_path(manifest_path)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=4)
+            os.replace(tmp, manifest_path)
+            self.generation = generation
+            self._remove_old_generations(generation)
+        print(f"Saved FAISS index with {self.index.ntotal} vectors to {self.index_dir}")
+
+    def _remove_old_generations(self, current: str) -> None:
+        """
+        Delete every generation but `current`, and files of the older single-directory layout.
+
+        Files still mapped (on Windows) cannot be deleted yet; they are left
+        for a later save to clean up.
+        """
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if name.startswith(GENERATION_PREFIX) and name != current or name == DOCUMENTS_DIR:
+                shutil.rmtree(path, ignore_errors=True)
+            elif name in (INDEX_FILE, EMBEDDINGS_FILE, LEXICAL_FILE):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        """Return the manifest of the persisted index, or None if there is none."""
+        try:
+            with open(os.path.join(self.index_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read_index(self) -> bool:
+        """
+        Replace the in-memory index with the one persisted in `index_dir`.
+
+        The caller holds the lock on `index_dir`.
+
+        Returns:
+            True if the index was read, False if it is missing, unreadable or built with another model.
+        """
+        manifest = self._read_manifest()
+        if manifest is None:
+            return False
+        if manifest.get("model_name") != self.model_name:
+            print(f"Persisted index in {self.index_dir} uses another model, rebuilding")
+            return False
+        # Indexes saved before generations keep their files directly in index_dir
+        generation_dir = os.path.join(self.index_dir, manifest.get("generation", ""))
+        try:
+            index = faiss.read_index(os.path.join(generation_dir, INDEX_FILE))
+            embeddings = np.load(os.path.join(generation_dir, EMBEDDINGS_FILE), mmap_mode='r')
+            documents = DocumentStore.open(os.path.join(generation_dir, DOCUMENTS_DIR))
+            document_keys = set(documents.keys())
+            lexical_path = os.path.join(generation_dir, LEXICAL_FILE)
+            if os.path.exists(lexical_path):
+                with open(lexical_path, 'rb') as f:
+                    lexical_index = pickle.load(f)
+            else:
+                # Index saved before lexical search existed: tokenizing is cheap, no re-embedding
+                lexical_index = BM25Index.from_texts(doc["content"] for doc in documents)
+        except Exception as e:
+            print(f"Error loading persisted index: {e}")
+            return False
+
+        configure_search(index)
+        with self._lock:
+            self.index = index
+            self.document_embeddings = embeddings
+            self.documents = documents
+            self.lexical_index = lexical_index
+            self._document_keys = document_keys
+            self.active_index_type = manifest.get("index_type", "flat")
+            self.active_quantization = manifest.get("quantization", "none")
+            self.embedding_store = dict(zip(documents.content_hashes(), embeddings))
+            self.source_hash = manifest.get("source_hash")
+            self.generation = manifest.get("generation")
+            self._index_changed()
+        print(f"Loaded {self.active_index_type} FAISS index with {self.index.ntotal} vectors from {self.index_dir}")
+        return True
+
+    def _needs_rebuild(self) -> bool:
+        """Return True if the configured index type or quantization differs from the loaded index."""
+        return (select_index_type(len(self.document_embeddings), self.index_type) != self.active_index_type
+                or self.quantization != self.active_quantization)
+
+    def _is_current(self) -> bool:
+        """Return True if the loaded index needs neither a rebuild nor a sync with the source."""
+        if self._needs_rebuild():
+            return False
+        source_hash = file_hash(self.json_path)
+        if source_hash is None:
+            return True
+        if source_hash != self.source_hash:
+            return False
+        self.source_mtime = os.path.getmtime(self.json_path)
+        return True
+
+    def load_index(self) -> bool:
+        """
+        Load the persisted index from `index_dir`, building or updating it if needed.
+
+        Processes sharing `index_dir` (e.g. uvicorn workers) read it under a
+        shared lock. A missing index, a changed index type or quantization, or
+        a changed source file needs the exclusive lock; the index is then read
+        again, since another process may have done the work meanwhile, so only
+        one of them builds. If the source file changed, the stored embeddings
+        are reused and only new or modified chunks are encoded.
+
+        Returns:
+            True if a persisted index was used, False if it was built from the JSON file.
+        """
+        with self._persist_lock(shared=True):
+            if self._read_index() and self._is_current():
+                return True
+
+        with self._persist_lock():
+            if not self._read_index():
+                # Load and process the JSON data
+                self.load_data()
+                self.build_index()
+                self.save_index()
+                return False
+
+            if self._needs_rebuild():
+                # The configured index type or quantization changed, rebuild from the stored vectors
+                with self._lock:
+                    self.document_embeddings = np.asarray(self.document_embeddings, dtype=self.embedding_dtype)
+                    self.embedding_store = dict(zip(self.documents.content_hashes(), self.document_embeddings))
+                    self.index = self._create_index(self.document_embeddings)
+                    self._index_changed()
+                self.save_index()
+
+            # The source changed since the index was saved: apply only the delta
+            if not self._is_current():
+                self.sync_from_source()
+        return True
+
+    def is_stale(self) -> bool:
+        """
+        Return True if the source JSON file changed since the index was built.
+
+        Without a source file (a video still streaming), return True once
+        another process saved a newer generation of the index.
+        """
+        try:
+            mtime = os.path.getmtime(self.json_path)
+        except OSError:
+            manifest = self._read_manifest() if self.index_dir else None
+            return manifest is not None and manifest.get("generation") != self.generation
+        if mtime == self.source_mtime:
+            return False
+        self.source_mtime = mtime
+        return file_hash(self.json_path) != self.source_hash
+
+    def search(self, query: str, top_k: int = 5, video_ids: Optional[Iterable[str]] = None,
+               start_minute: Optional[int] = None, end_minute: Optional[int] = None,
+               mode: str = DEFAULT_SEARCH_MODE) -> List[Dict[str, Any]]:
         """
         Search for documents similar to the query.
-        
+
         Args:
             query: The search query.
             top_k: Number of results to return.
-            
+            video_ids: Only return documents from these videos (playlist shards).
+            start_minute: Only return documents from this transcript minute onwards.
+            end_minute: Only return documents up to and including this minute.
+            mode: One of SEARCH_MODES, see `search_many`.
+
         Returns:
             List of documents with similarity scores.
         """
-        if not self.index:
-            return []
-        
-        # Encode the query
-        query_embedding = self.encoder.encode([query])
-        query_embedding = np.array(query_embedding).astype('float32')
-        faiss.normalize_L2(query_embedding)
-        
-        # Search the index
-        distances, indices = self.index.search(query_embedding, top_k)
-        
-        # Prepare results
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1:  # Valid index
-                results.append({
-                    "id": self.documents[idx]["metadata"].get("id", f"doc_{idx}"),
-                    "content": self.documents[idx]["content"],
-                    "metadata": self.documents[idx]["metadata"],
-                    "score": float(1 - distances[0][i])  # Convert distance to similarity score
-                })
-        
-        return results
-
-def rag_main(query: str) -> str:
-    """
-    Main function to initialize RAG and perform search.
+        return self.search_many([query], top_k, video_ids, start_minute, end_minute, mode)[0]
+
+    def resolve_mode(self, query: str, mode: str = DEFAULT_SEARCH_MODE) -> str:
+        """
+        Resolve "auto" to a concrete retrieval mode for `query`.
+
+        Short, symbolic queries such as "x^2 + 3x + 2" or "dy/dx" go to BM25
+        alone, skipping the encoder entirely; everything else uses hybrid search.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}")
+        if mode != "auto":
+            return mode
+        if is_symbolic_query(query) and self.lexical_index.covers(query):
+            return "lexical"
+        return "hybrid"
+
+    def search_many(self, queries: List[str], top_k: int = 5, video_ids: Optional[Iterable[str]] = None,
+                    start_minute: Optional[int] = None, end_minute: Optional[int] = None,
+                    mode: str = DEFAULT_SEARCH_MODE) -> List[List[Dict[str, Any]]]:
+        """
+        Search for several queries with one encoder pass and one index search.
+
+        Dense mode ranks by embedding similarity, lexical mode by BM25 over the
+        inverted index, and hybrid mode fuses both rankings with reciprocal rank
+        fusion. The `score` of a result is the cosine-style similarity, the BM25
+        score or the fused score respectively. With filters, more candidates
+        than `top_k` are fetched and widened until enough documents match.
+
+        Args:
+            queries: The search queries.
+            top_k: Number of results to return per query.
+            video_ids: Only return documents from these videos (playlist shards).
+            start_minute: Only return documents from this transcript minute onwards.
+            end_minute: Only return documents up to and including this minute.
+            mode: "dense", "lexical", "hybrid" or "auto" (per query, see `resolve_mode`).
+
+        Returns:
+            One list of documents with similarity scores per query, in order.
+        """
+        # Take a consistent snapshot, documents may be added or removed concurrently
+        with self._lock:
+            index, documents, lexical_index = self.index, self.documents, self.lexical_index
+            version = self.index_version
+        if index is None or not len(documents) or not queries:
+            return [[] for _ in queries]
+
+        video_ids = set(video_ids) if video_ids else None
+        filtered = bool(video_ids) or start_minute is not None or end_minute is not None
+        filter_key = (tuple(sorted(video_ids)) if video_ids else None, start_minute, end_minute, mode)
+
+        # Serve repeated questions from the result cache
+        normalized = [normalize_query(query) for query in queries]
+        all_results: List[Optional[List[Dict[str, Any]]]] = [
+            self.result_cache.get((text, top_k, version, filter_key)) for text in normalized
+        ]
+        pending = [i for i, results in enumerate(all_results) if results is None]
+        if not pending:
+            return [list(results) for results in all_results]
+
+        modes = {i: self.resolve_mode(queries[i], mode) for i in pending}
+
+        # Encode only dense/hybrid queries whose embedding is not cached, in a single batch
+        dense_pending = [i for i in pending if modes[i] != "lexical"]
+        embeddings = {i: self.query_embedding_cache.get(normalized[i]) for i in dense_pending}
+        to_encode = [i for i in dense_pending if embeddings[i] is None]
+        if to_encode:
+            encoded = self.encoder.encode([queries[i] for i in to_encode], batch_size=max(32, len(to_encode)))
+            encoded = np.array(encoded).astype('float32')
+            faiss.normalize_L2(encoded)
+            for i, embedding in zip(to_encode, encoded):
+                embeddings[i] = embedding
+                self.query_embedding_cache.set(normalized[i], embedding)
+
+        # Rank candidates, over-fetching when results get filtered or fused
+        num_documents = len(documents)
+        hybrid = any(m == "hybrid" for m in modes.values())
+        fetch_k = min(num_documents, max(top_k * 4, HYBRID_CANDIDATES if hybrid else 0)) if filtered or hybrid else top_k
+        remaining = pending
+        while remaining:
+            dense_rankings = {}
+            dense_rows = [i for i in remaining if modes[i] != "lexical"]
+            if dense_rows:
+                query_embeddings = np.array([embeddings[i] for i in dense_rows], dtype='float32')
+                distances, indices = index.search(query_embeddings, fetch_k)
+                for i, row_distances, row_indices in zip(dense_rows, distances, indices):
+                    # Convert distance to similarity score
+                    dense_rankings[i] = [(int(idx), float(1 - d)) for d, idx in zip(row_distances, row_indices)
+                                         if idx != -1 and idx < num_documents]
+
+            still_short = []
+            for i in remaining:
+                if modes[i] == "dense":
+                    ranking = dense_rankings[i]
+                else:
+                    lexical = [(p, s) for p, s in lexical_index.search(queries[i], fetch_k) if p < num_documents]
+                    ranking = lexical if modes[i] == "lexical" else reciprocal_rank_fusion([dense_rankings[i], lexical])
+
+                results = []
+                for idx, score in ranking:
+                    document = documents[idx]
+                    if filtered and not matches_filters(document["metadata"], video_ids, start_minute, end_minute):
+                        continue
+                    results.append({
+                        "id": document["metadata"].get("id", f"doc_{idx}"),
+                        "content": document["content"],
+                        "metadata": document["metadata"],
+                        "score": score
+                    })
+                    if len(results) == top_k:
+                        break
+
+                if len(results) < top_k and fetch_k < num_documents:
+                    still_short.append(i)
+                else:
+                    all_results[i] = results
+                    self.result_cache.set((normalized[i], top_k, version, filter_key), results)
+            remaining = still_short
+            fetch_k = min(num_documents, fetch_k * 4)
+
+        return [list(results) for results in all_results]
+
+
+class QueryBatcher:
+    def __init__(self, rag: RAGSystem, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        """
+        Coalesce concurrent async searches into batched `search_many` calls.
+
+        Queries arriving within `max_wait_ms` of the first pending query (or until
+        `max_batch_size` are pending) share one encoder pass and one index search,
+        which runs in a worker thread so the event loop stays free.
+
+        Args:
+            rag: The RAG system to search.
+            max_batch_size: Flush as soon as this many queries are pending.
+            max_wait_ms: Longest time the first query of a batch waits for company.
+        """
+        self.rag = rag
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[str, int, asyncio.Future]] = []
+        self._flush_handle = None
+
+    async def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Queue `query` for the next batch and wait for its results."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, top_k, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """Hand the pending queries to a worker thread as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[Tuple[str, int, asyncio.Future]]) -> None:
+        queries = [query for query, _, _ in batch]
+        top_k = max(k for _, k, _ in batch)
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(None, self.rag.search_many, queries, top_k)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, k, future), query_results in zip(batch, results):
+            if not future.done():
+                future.set_result(query_results[:k])
+
+
+def get_rag_system(json_path: str = DEFAULT_JSON_PATH,
+                   index_dir: Optional[str] = DEFAULT_INDEX_DIR,
+                   model_name: str = DEFAULT_MODEL_NAME,
+                   index_type: str = os.getenv("RAG_INDEX_TYPE", "auto"),
+                   quantization: str = os.getenv("RAG_QUANTIZATION", "none")) -> RAGSystem:
+    """
+    Return the long-lived RAG system for `json_path`, creating it on first use.
+
+    The instance is shared by every caller in the process. If the source JSON
+    file has changed since the index was built, only the new or modified
+    chunks are embedded and the index is persisted again before being returned.
 
     Args:
-        query: The input query string.
+        json_path: Path to the JSON file containing the text data.
+        index_dir: Directory holding the persisted index.
+        model_name: Name of the sentence-transformer model to use.
+        index_type: "auto" or one of INDEX_TYPES, used when the system is first created.
+        quantization: One of QUANTIZATIONS, used when the system is first created.
 
     Returns:
-        A formatted string of search results.
-    """
-    # Path to your JSON file
-    json_path = r"A:\Projects\Edu_Pro\backend\data\single.json"
-    
-    # Initialize the RAG system
-    rag = RAGSystem(json_path)
-    
-    # Get results
-    results = rag.search(query, top_k=3)
-    
-    # Display results
+        The shared RAGSystem.
+    """
+    with _rag_systems_lock:
+        lock = _rag_system_locks.setdefault(json_path, threading.Lock())
+    with lock:
+        rag = _rag_systems.get(json_path)
+        if rag is None:
+            rag = RAGSystem(json_path, model_name=model_name, index_dir=index_dir,
+                            index_type=index_type, quantization=quantization)
+            with _rag_systems_lock:
+                _rag_systems[json_path] = rag
+        elif rag.is_stale():
+            rag.sync_from_source()
+        return rag
+
+
+def get_query_batcher(rag: Optional[RAGSystem] = None) -> QueryBatcher:
+    """Return the process-wide micro-batcher for the default RAG system."""
+    global _query_batcher
+    rag = rag or get_rag_system()
+    if _query_batcher is None or _query_batcher.rag is not rag:
+        _query_batcher = QueryBatcher(rag)
+    return _query_batcher
+
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    """Format search results for inclusion in a prompt."""
     if not results:
         return "No relevant documents found."
 
@@ -141,6 +1091,179 @@ def rag_main(query: str) -> str:
         for i, r in enumerate(results)
     ])
 
+
+def get_shard(shard_id: str) -> RAGSystem:
+    """Return the shared RAG system for one video or playlist shard."""
+    return get_rag_system(shard_source_path(shard_id), shard_index_dir(shard_id))
+
+
+def search_shards(query: str, shard_ids: Optional[Iterable[str]] = None, top_k: int = 3,
+                  video_ids: Optional[Iterable[str]] = None, start_minute: Optional[int] = None,
+                  end_minute: Optional[int] = None, mode: str = DEFAULT_SEARCH_MODE) -> List[Dict[str, Any]]:
+    """
+    Search the selected shards and merge their results into one ranking.
+
+    The mode is resolved once for the query across all shards. Dense results
+    are merged by similarity, which is comparable between shards because they
+    share the encoder. BM25 scores are not, since every shard has its own term
+    statistics, so with several shards a lexical search fuses the per-shard
+    BM25 rankings with reciprocal rank fusion, without running dense search,
+    and a hybrid search fuses the merged dense and lexical rankings.
+
+    Args:
+        query: The search query.
+        shard_ids: Shards to search, or None for every shard.
+        top_k: Number of results to return overall.
+        video_ids: Only return documents from these videos.
+        start_minute: Only return documents from this transcript minute onwards.
+        end_minute: Only return documents up to and including this minute.
+        mode: One of SEARCH_MODES, see `RAGSystem.search_many`.
+
+    Returns:
+        The best `top_k` documents across shards, each tagged with its `shard`.
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode {mode!r}, expected one of {SEARCH_MODES}")
+    shards = {}
+    for shard_id in (list_shards() if shard_ids is None else shard_ids):
+        if not shard_exists(shard_id):
+            print(f"No transcript for shard {shard_id}, skipping")
+            continue
+        shards[shard_id] = get_shard(shard_id)
+    if mode == "auto":
+        symbolic = is_symbolic_query(query) and any(rag.lexical_index.covers(query) for rag in shards.values())
+        mode = "lexical" if symbolic else "hybrid"
+
+    if len(shards) == 1:
+        shard_id, rag = next(iter(shards.items()))
+        return [dict(r, shard=shard_id)
+                for r in rag.search(query, top_k, video_ids, start_minute, end_minute, mode)]
+
+    fetch_k = top_k if mode == "dense" else max(top_k * 4, HYBRID_CANDIDATES)
+    if mode == "lexical":
+        # One ranking per shard: its BM25 scores only order documents within that shard
+        rankings = {shard_id: [dict(r, shard=shard_id)
+                               for r in rag.search(query, fetch_k, video_ids, start_minute, end_minute, "lexical")]
+                    for shard_id, rag in shards.items()}
+    else:
+        rankings = {"dense": [], "lexical": []}
+        for shard_id, rag in shards.items():
+            for ranking_mode in (["dense"] if mode == "dense" else ["dense", "lexical"]):
+                shard_results = rag.search(query, fetch_k, video_ids, start_minute, end_minute, ranking_mode)
+                rankings[ranking_mode].extend(dict(r, shard=shard_id) for r in shard_results)
+        for ranking in rankings.values():
+            ranking.sort(key=lambda r: r["score"], reverse=True)
+    if mode == "dense":
+        return rankings["dense"][:top_k]
+
+    # Fuse the rankings by rank, keyed by shard and document id
+    results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    positions: Dict[Tuple[str, str], int] = {}
+    fused_input = []
+    for ranking in rankings.values():
+        pairs = []
+        for r in ranking:
+            key = (r["shard"], r["id"])
+            results.setdefault(key, r)
+            pairs.append((positions.setdefault(key, len(positions)), r["score"]))
+        fused_input.append(pairs)
+    keys = list(positions)
+    similarity = {(r["shard"], r["id"]): r["score"] for r in rankings.get("dense", [])}
+    fused = reciprocal_rank_fusion(fused_input)
+    # Equal ranks give equal fused scores; in hybrid mode the more similar document goes first
+    fused.sort(key=lambda item: (round(item[1], 9), similarity.get(keys[item[0]], -1.0)), reverse=True)
+    return [dict(results[keys[position]], score=score) for position, score in fused[:top_k]]
+
+
+def selected_shards(video_ids: Optional[List[str]] = None, playlist_id: Optional[str] = None) -> Optional[List[str]]:
+    """Return the shards a video or playlist selection searches, or None for the default transcript."""
+    if playlist_id:
+        return [playlist_id]
+    return list(video_ids) if video_ids else None
+
+
+def corpus_version(video_ids: Optional[List[str]] = None, playlist_id: Optional[str] = None,
+                   start_minute: Optional[int] = None, end_minute: Optional[int] = None
+                   ) -> Tuple[Hashable, Hashable]:
+    """
+    Identify what a search with this selection runs against, for the answer cache.
+
+    The corpus part names the shards (or the default transcript) together
+    with the video and minute filters, so answers about different selections
+    never mix. The version part changes whenever any searched shard changes.
+
+    Returns:
+        (corpus, version), see `SemanticAnswerCache.get`.
+    """
+    shard_ids = selected_shards(video_ids, playlist_id)
+    if shard_ids is None:
+        corpus, version = get_rag_system().corpus_version
+    else:
+        corpus = tuple(shard_ids)
+        version = tuple((shard_id, get_shard(shard_id).index_version) for shard_id in shard_ids
+                        if shard_exists(shard_id))
+    return (corpus, tuple(video_ids or ()), start_minute, end_minute), version
+
+
+def rag_main(query: str, video_ids: Optional[List[str]] = None, playlist_id: Optional[str] = None,
+             start_minute: Optional[int] = None, end_minute: Optional[int] = None) -> str:
+    """
+    Main function to search the shared RAG system.
+
+    Without a video or playlist, the default transcript (single.json) is
+    searched. Otherwise the query is routed to the per-video shards, or to the
+    playlist shard with `video_ids` narrowing the results inside it.
+
+    Args:
+        query: The input query string.
+        video_ids: Videos to search.
+        playlist_id: Playlist shard to search.
+        start_minute: Only use transcript from this minute onwards.
+        end_minute: Only use transcript up to and including this minute.
+
+    Returns:
+        The search results as compact prompt context (see `assemble_context`).
+    """
+    shard_ids = selected_shards(video_ids, playlist_id)
+    if shard_ids is not None:
+        results = search_shards(query, shard_ids, CONTEXT_CANDIDATES, video_ids, start_minute, end_minute)
+        return assemble_context(results)
+
+    # Reuse the process-wide RAG system instead of rebuilding it per query
+    rag = get_rag_system()
+
+    # Get results
+    results = rag.search(query, top_k=CONTEXT_CANDIDATES, start_minute=start_minute, end_minute=end_minute)
+
+    # Merge, deduplicate and trim the results to the prompt's context budget
+    return assemble_context(results)
+
+
+async def rag_main_async(query: str, video_ids: Optional[List[str]] = None, playlist_id: Optional[str] = None,
+                         start_minute: Optional[int] = None, end_minute: Optional[int] = None) -> str:
+    """
+    Async variant of `rag_main` that batches concurrent queries together.
+
+    Only unfiltered queries on the default transcript are micro-batched;
+    shard and minute-range searches run on the default executor.
+
+    Args:
+        query: The input query string.
+        video_ids: Videos to search.
+        playlist_id: Playlist shard to search.
+        start_minute: Only use transcript from this minute onwards.
+        end_minute: Only use transcript up to and including this minute.
+
+    Returns:
+        The search results as compact prompt context (see `assemble_context`).
+    """
+    loop = asyncio.get_running_loop()
+    if video_ids or playlist_id or start_minute is not None or end_minute is not None:
+        return await loop.run_in_executor(None, rag_main, query, video_ids, playlist_id, start_minute, end_minute)
+    rag = await loop.run_in_executor(None, get_rag_system)
+    results = await get_query_batcher(rag).search(query, top_k=CONTEXT_CANDIDATES)
+    return assemble_context(results)
+
 # Uncomment to test
 # if __name__ == "__main__":
 #     query = input("Enter your query: ")
@@ -0,0 +1,197 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+ROUTER_ENABLED = os.getenv("INTENT_ROUTER", "1").lower() in ("1", "true", "yes")
+# Minimum cosine similarity to a prototype for a non-question intent
+ROUTER_THRESHOLD = float(os.getenv("INTENT_ROUTER_THRESHOLD", "0.6"))
+# How much closer a non-question intent must be than the closest question prototype
+ROUTER_MARGIN = 0.05
+
+# Whole-message patterns handled without loading any model
+RULES = {
+    "greeting": re.compile(r"^(hi+|hello+|hey+|hiya|yo|greetings|good (morning|afternoon|evening))"
+                           r"( there| everyone| tutor)?[\s!.,:)]*$"),
+    "thanks": re.compile(r"^((ok(ay)?|great|cool|awesome|perfect)[\s,!]*)?(thanks|thank you|thx|ty)"
+                         r"( (so|very) much| a lot)?[\s!.,:)]*$"),
+    "farewell": re.compile(r"^(bye+|goodbye|see (you|ya)|good night|that'?s all)( for now)?[\s!.,:)]*$"),
+    "help": re.compile(r"^(help|\?+|what can you do|how does this work|how do i use this)[\s?!.]*$"),
+}
+
+# Example messages per intent for the embedding classifier
+PROTOTYPES = {
+    "help": [
+        "what can you help me with",
+        "how do I use this assistant",
+        "what kind of questions can I ask you",
+        "what are you able to do",
+    ],
+    "off_topic": [
+        "what is the weather like today",
+        "tell me a joke",
+        "who won the football match yesterday",
+        "recommend a good movie to watch",
+        "write me a poem about love",
+        "what is the latest news",
+    ],
+    "followup": [
+        "can you explain that again",
+        "I did not understand your answer",
+        "can you make it simpler",
+        "give me another example of that",
+        "why is that",
+        "summarize what you just said",
+    ],
+    "question": [
+        "what is the derivative of x squared",
+        "how do I solve a quadratic equation",
+        "explain the chain rule",
+        "what did the lecture say about integration",
+        "solve 2x + 3 = 7",
+        "what is a limit in calculus",
+        "prove that the square root of two is irrational",
+        "how do you find the area of a circle",
+    ],
+}
+
+EXAMPLE_QUESTIONS = [
+    "What is the derivative of x^2 + 3x?",
+    "Can you explain the chain rule from the lecture?",
+    "How do I solve a quadratic equation?",
+]
+
+RESPONSES = {
+    "greeting": "Hello! What can I assist you with today? Here are some example questions you can ask me:\n"
+                + "\n".join(f"- {q}" for q in EXAMPLE_QUESTIONS),
+    "thanks": "You're welcome! Let me know if you have another question.",
+    "farewell": "Goodbye! Come back any time you have a Mathematics question.",
+    "help": "I answer Mathematics questions using the lecture videos you have added. Ask about a concept, "
+            "a step you didn't follow or a problem to solve, for example:\n"
+            + "\n".join(f"- {q}" for q in EXAMPLE_QUESTIONS),
+    "off_topic": "I can only help with Mathematics and the lecture videos. Try asking about a concept or a problem, "
+                 "for example: " + EXAMPLE_QUESTIONS[0],
+}
+
+_router: Optional["IntentRouter"] = None
+_router_lock = threading.Lock()
+
+
+def decision(intent: str, confidence: float, history: str = "", standalone: bool = True) -> Dict[str, Any]:
+    """
+    Describe how a message should be handled.
+
+    Args:
+        intent: Classified intent.
+        confidence: Similarity to the intent's prototypes, 1.0 for rule matches.
+        history: Conversation history; follow-ups need some to refer to.
+        standalone: False if the message could also be a follow-up, so its
+            answer may depend on the conversation.
+
+    Returns:
+        {"intent", "confidence", "response": canned reply or None,
+         "retrieve": whether to search the transcripts, "llm": whether to call the LLM,
+         "cache": whether the answer may be shared through the answer cache}
+    """
+    if intent == "followup" and not history:
+        # Nothing to follow up on, treat it as a question
+        intent = "question"
+    response = RESPONSES.get(intent)
+    return {
+        "intent": intent,
+        "confidence": confidence,
+        "response": response,
+        "retrieve": intent == "question",
+        "llm": response is None,
+        "cache": intent == "question" and (standalone or not history),
+    }
+
+
+def match_rules(message: str) -> Optional[str]:
+    """Return the intent of a message matching one of the RULES, if any."""
+    text = " ".join(message.lower().split())
+    for intent, pattern in RULES.items():
+        if pattern.match(text):
+            return intent
+    return None
+
+
+class IntentRouter:
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], threshold: float = ROUTER_THRESHOLD,
+                 margin: float = ROUTER_MARGIN):
+        """
+        Nearest-prototype intent classifier over sentence embeddings.
+
+        Args:
+            encode: Returns normalized embeddings for a list of texts; the RAG
+                encoder, so a message is embedded once for routing and retrieval.
+            threshold: Minimum similarity for a non-question intent.
+            margin: Required lead of a non-question intent over "question".
+        """
+        self.encode = encode
+        self.threshold = threshold
+        self.margin = margin
+        self._prototypes: Optional[Dict[str, np.ndarray]] = None
+
+    @property
+    def prototypes(self) -> Dict[str, np.ndarray]:
+        if self._prototypes is None:
+            self._prototypes = {intent: np.asarray(self.encode(texts), dtype='float32')
+                                for intent, texts in PROTOTYPES.items()}
+        return self._prototypes
+
+    def classify(self, embedding: np.ndarray) -> Dict[str, Any]:
+        """
+        Classify a normalized message embedding.
+
+        Anything not clearly closer to another intent is a "question", so when
+        in doubt the message still gets retrieval and a full answer.
+
+        Returns:
+            {"intent": str, "confidence": cosine similarity to the best prototype,
+             "standalone": False if the message is close enough to a follow-up to possibly be one}
+        """
+        scores = {intent: float(np.max(vectors @ embedding)) for intent, vectors in self.prototypes.items()}
+        intent = max(scores, key=scores.get)
+        if intent != "question" and (scores[intent] < self.threshold
+                                     or scores[intent] - scores["question"] < self.margin):
+            intent = "question"
+        return {"intent": intent, "confidence": scores[intent], "standalone": scores["followup"] < self.threshold}
+
+
+def get_intent_router(encode: Callable[[List[str]], np.ndarray]) -> IntentRouter:
+    """Return the process-wide router, created with `encode` on first use."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = IntentRouter(encode)
+        return _router
+
+
+def route(message: str, embed: Callable[[str], np.ndarray], encode: Callable[[List[str]], np.ndarray],
+          history: str = "") -> Dict[str, Any]:
+    """
+    Decide how to handle `message`: canned reply, LLM only, or retrieval plus LLM.
+
+    Rules are tried first and need no model; other messages are classified
+    with the embedding classifier. Blocking, run it off the event loop.
+
+    Args:
+        message: The user's message.
+        embed: Returns the normalized embedding of one text (cached by the RAG system).
+        encode: Returns normalized embeddings for a list of texts.
+        history: Conversation history; follow-ups need some to refer to.
+
+    Returns:
+        See `decision`.
+    """
+    if not ROUTER_ENABLED:
+        # Unclassified, so only a chat's first question may use the answer cache
+        return decision("question", 0.0, history, standalone=False)
+    intent = match_rules(message)
+    if intent:
+        return decision(intent, 1.0, history)
+    result = get_intent_router(encode).classify(embed(message))
+    return decision(result["intent"], result["confidence"], history, result["standalone"])
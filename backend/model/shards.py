@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import re
+from typing import Any, Dict, Iterable, List
+
+DATA_DIR = os.getenv("RAG_DATA_DIR", r"A:\Projects\Edu_Pro\backend\data")
+SHARDS_DIR = os.path.join(DATA_DIR, "shards")
+
+SHARD_SOURCE_FILE = "transcript.json"
+# Segments appended while a video is still being transcribed
+SHARD_STREAM_FILE = "transcript.jsonl"
+SHARD_INDEX_DIR = "index"
+# Written last by every save of a shard's RAG index (see RAGSystem.save_index)
+SHARD_MANIFEST_FILE = "manifest.json"
+
+
+def _safe_shard_id(shard_id: str) -> str:
+    """Reject shard ids that could escape the shards directory."""
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", shard_id):
+        raise ValueError(f"Invalid shard id {shard_id!r}")
+    return shard_id
+
+
+def playlist_shard_id(video_ids: Iterable[str]) -> str:
+    """Derive a stable shard id for a batch of videos fetched together."""
+    digest = hashlib.sha1(",".join(sorted(video_ids)).encode('utf-8')).hexdigest()
+    return f"playlist_{digest[:12]}"
+
+
+def shard_source_path(shard_id: str) -> str:
+    """Path of the transcript JSON a shard is built from."""
+    return os.path.join(SHARDS_DIR, _safe_shard_id(shard_id), SHARD_SOURCE_FILE)
+
+
+def shard_index_dir(shard_id: str) -> str:
+    """Directory holding a shard's persisted RAG index."""
+    return os.path.join(SHARDS_DIR, _safe_shard_id(shard_id), SHARD_INDEX_DIR)
+
+
+def write_shard(shard_id: str, data: Any) -> str:
+    """
+    Write the transcript for one shard (a video or a playlist).
+
+    The file is replaced atomically, so a RAG system syncing from it never
+    reads a half-written transcript.
+
+    Args:
+        shard_id: Video id, or a playlist id from `playlist_shard_id`.
+        data: Transcript JSON, either a list of captions or a dict of minutes.
+
+    Returns:
+        The path of the written transcript.
+    """
+    path = shard_source_path(shard_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def shard_stream_path(shard_id: str) -> str:
+    """Path of the incremental JSONL transcript of a shard."""
+    return os.path.join(SHARDS_DIR, _safe_shard_id(shard_id), SHARD_STREAM_FILE)
+
+
+def reset_segments(shard_id: str) -> str:
+    """Start a new incremental transcript for a shard, discarding any previous one."""
+    path = shard_stream_path(shard_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w", encoding="utf-8").close()
+    return path
+
+
+def append_segments(shard_id: str, segments: Iterable[Dict[str, Any]]) -> None:
+    """
+    Append segments to a shard's incremental transcript, one JSON object per line.
+
+    Each call is flushed, so a crash loses at most the segments of the call in progress.
+    """
+    with open(shard_stream_path(shard_id), "a", encoding="utf-8") as f:
+        for segment in segments:
+            f.write(json.dumps(segment, ensure_ascii=False) + "\n")
+        f.flush()
+
+
+def read_segments(shard_id: str) -> List[Dict[str, Any]]:
+    """Read a shard's incremental transcript, ignoring a partially written last line."""
+    segments = []
+    try:
+        with open(shard_stream_path(shard_id), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    segments.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+    except FileNotFoundError:
+        pass
+    return segments
+
+
+def shard_exists(shard_id: str) -> bool:
+    """
+    Return True if a shard can be searched.
+
+    That is the case once its transcript is written, and already while a
+    video is still streaming: its transcript.jsonl exists from the start and
+    the ingesting process persists the index every few batches.
+    """
+    return (os.path.exists(shard_source_path(shard_id))
+            or os.path.exists(shard_stream_path(shard_id))
+            or os.path.exists(os.path.join(shard_index_dir(shard_id), SHARD_MANIFEST_FILE)))
+
+
+def list_shards() -> List[str]:
+    """Return the ids of every shard that can be searched, see `shard_exists`."""
+    if not os.path.isdir(SHARDS_DIR):
+        return []
+    return sorted(
+        name for name in os.listdir(SHARDS_DIR)
+        if re.fullmatch(r"[A-Za-z0-9_-]+", name) and shard_exists(name)
+    )
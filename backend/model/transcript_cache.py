@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from model.cache import LRUCache
+from model.docstore import tmp_path
+from model.shards import DATA_DIR
+
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", os.path.join(DATA_DIR, "transcript_cache"))
+# Recently used transcripts kept in memory in front of the files
+TRANSCRIPT_MEMORY_CACHE_SIZE = 256
+
+_transcript_cache: Optional["TranscriptCache"] = None
+_transcript_cache_lock = threading.Lock()
+
+
+def audio_hash(path: str) -> str:
+    """Return the SHA-256 hex digest of an audio file's content."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", value)
+
+
+def captions_key(video_id: str) -> str:
+    """Key of the YouTube captions of a video."""
+    return f"captions/{_slug(video_id)}"
+
+
+def whisper_video_key(video_id: str, model_version: str) -> str:
+    """Key of a Whisper transcript of a YouTube video, per model version."""
+    return f"whisper/{_slug(model_version)}/video/{_slug(video_id)}"
+
+
+def whisper_audio_key(content_hash: str, model_version: str) -> str:
+    """Key of a Whisper transcript of audio content (uploads and downloads), per model version."""
+    return f"whisper/{_slug(model_version)}/audio/{content_hash}"
+
+
+class TranscriptCache:
+    def __init__(self, root: str = TRANSCRIPT_CACHE_DIR, memory_size: int = TRANSCRIPT_MEMORY_CACHE_SIZE):
+        """
+        Content-addressed store of finished transcripts, one JSON file per key.
+
+        Keys name what was transcribed and how (see `captions_key`,
+        `whisper_video_key`, `whisper_audio_key`), so a stored transcript never
+        needs invalidating; a new Whisper model simply produces new keys.
+        Concurrent requests for the same key share a single computation.
+
+        Args:
+            root: Directory holding the cached transcripts.
+            memory_size: Number of transcripts also kept in memory.
+        """
+        self.root = root
+        self.memory = LRUCache(memory_size)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.deduplicated = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/")) + ".json"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the stored transcript for `key`, or None."""
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a transcript under `key`; the file is replaced atomically."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique temporary name: another worker process may be storing the same key
+        tmp = tmp_path(path)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self.memory.set(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Return the transcript for `key`, computing and storing it on a miss.
+
+        If another thread is already computing the same key, wait for its
+        result instead of starting a second download or transcription. Errors
+        are passed to every waiter and nothing is stored, so the next request
+        tries again.
+
+        Args:
+            key: Cache key.
+            compute: Produces the transcript; called at most once per concurrent miss.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.deduplicated += 1
+        if not owner:
+            return future.result()
+
+        try:
+            # Another request may have finished between the lookup and taking ownership
+            value = self.get(key)
+            if value is None:
+                value = compute()
+                self.computed += 1
+                if value is not None:
+                    self.set(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return computation counters and the in-memory cache's hit/miss counters."""
+        return {"computed": self.computed, "deduplicated": self.deduplicated, "memory": self.memory.stats()}
+
+
+def get_transcript_cache() -> TranscriptCache:
+    """Return the process-wide transcript cache."""
+    global _transcript_cache
+    with _transcript_cache_lock:
+        if _transcript_cache is None:
+            _transcript_cache = TranscriptCache()
+        return _transcript_cache
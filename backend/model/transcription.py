@@ -0,0 +1,361 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import whisper
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE") or None
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "1"))
+# Identifies the transcripts this configuration produces, for the transcript cache
+WHISPER_MODEL_VERSION = f"{WHISPER_MODEL}-{getattr(whisper, '__version__', 'unknown')}"
+
+# Parallel mode: audio is cut near every CHUNK_SECONDS at the quietest point within SILENCE_SEARCH_SECONDS
+WHISPER_PARALLEL = os.getenv("WHISPER_PARALLEL", "0").lower() in ("1", "true", "yes")
+WHISPER_PROCESSES = int(os.getenv("WHISPER_PROCESSES", "0")) or max(1, (os.cpu_count() or 2) // 2)
+CHUNK_SECONDS = float(os.getenv("WHISPER_CHUNK_SECONDS", "120"))
+# Streaming mode uses shorter chunks so the first segments arrive sooner
+STREAM_CHUNK_SECONDS = float(os.getenv("WHISPER_STREAM_CHUNK_SECONDS", "30"))
+SILENCE_SEARCH_SECONDS = 10.0
+SILENCE_FRAME_SECONDS = 0.03
+SAMPLE_RATE = whisper.audio.SAMPLE_RATE
+
+_service: Optional["TranscriptionService"] = None
+_service_lock = threading.Lock()
+_parallel: Optional["ParallelTranscriber"] = None
+# Model of the current pool process, loaded once by _init_process
+_process_model = None
+
+
+class TranscriptionService:
+    def __init__(self, model_size: str = WHISPER_MODEL, workers: int = WHISPER_WORKERS,
+                 device: Optional[str] = WHISPER_DEVICE):
+        """
+        Pool of worker threads that each keep a Whisper model loaded.
+
+        Every worker loads its model once, when the service starts, and then
+        serves transcription jobs from a shared queue, so no job pays for a
+        model load. Load time and per-job time are recorded separately.
+
+        Args:
+            model_size: Whisper model name (tiny, base, small, medium, large...).
+            workers: Number of resident models; more than one mainly helps on GPU.
+            device: Torch device, e.g. "cuda" or "cpu", or None for Whisper's default.
+        """
+        self.model_size = model_size
+        self.workers = max(1, workers)
+        self.device = device
+        self._jobs: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._ready = threading.Event()
+        self._load_error: Optional[Exception] = None
+        self._load_failures = 0
+        self._lock = threading.Lock()
+        self.load_seconds: List[float] = []
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.transcribe_seconds = 0.0
+
+    def start(self) -> None:
+        """
+        Start the workers and wait until a model is loaded (idempotent).
+
+        Raises:
+            Exception: The load error, if no worker could load its model.
+        """
+        with self._lock:
+            if not self._threads:
+                self._load_error = None
+                self._load_failures = 0
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._worker, name=f"whisper-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+        self._ready.wait()
+        with self._lock:
+            if not self.load_seconds and self._load_error is not None:
+                # Let the next call retry the load
+                self._threads = []
+                self._ready.clear()
+                raise self._load_error
+
+    def _worker(self) -> None:
+        started = time.perf_counter()
+        print(f"Loading Whisper model {self.model_size}...")
+        try:
+            model = whisper.load_model(self.model_size, device=self.device)
+        except Exception as e:
+            print(f"❌ Error loading Whisper model {self.model_size}: {e}")
+            with self._lock:
+                self._load_error = e
+                self._load_failures += 1
+                # Only wake start() once every worker has failed
+                if self._load_failures == len(self._threads):
+                    self._ready.set()
+            return
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.load_seconds.append(elapsed)
+        print(f"✅ Whisper model {self.model_size} loaded in {elapsed:.1f}s")
+        self._ready.set()
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            audio_path, options, future, queued_at = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.perf_counter()
+            try:
+                result = model.transcribe(audio_path, **options)
+            except Exception as e:
+                with self._lock:
+                    self.jobs_failed += 1
+                future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.jobs_done += 1
+                self.transcribe_seconds += elapsed
+            result["timing"] = {"queue_seconds": started - queued_at, "transcribe_seconds": elapsed}
+            future.set_result(result)
+
+    def submit(self, audio_path: Union[str, np.ndarray], **options: Any) -> Future:
+        """
+        Queue an audio file for transcription.
+
+        Args:
+            audio_path: Path of the audio file, or 16 kHz mono samples.
+            **options: Passed on to `whisper.Whisper.transcribe`.
+
+        Returns:
+            A future resolving to Whisper's result dict, plus a `timing` entry
+            with the seconds spent queued and transcribing.
+        """
+        self.start()
+        future: Future = Future()
+        self._jobs.put((audio_path, options, future, time.perf_counter()))
+        return future
+
+    def transcribe(self, audio_path: str, **options: Any) -> Dict[str, Any]:
+        """Transcribe an audio file and wait for the result (see `submit`)."""
+        return self.submit(audio_path, **options).result()
+
+    def iter_segments(self, audio_path: str, chunk_seconds: float = STREAM_CHUNK_SECONDS,
+                      **options: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the segments of an audio file as its chunks finish transcribing.
+
+        The audio is split at silences and every chunk is queued at once, so
+        the workers keep transcribing while the caller handles earlier segments.
+
+        Args:
+            audio_path: Path of the audio file.
+            chunk_seconds: Target chunk length; see `split_at_silence`.
+            **options: Passed on to `whisper.Whisper.transcribe` for every chunk.
+
+        Yields:
+            Whisper segments in order, with timestamps relative to the whole file.
+        """
+        audio = whisper.load_audio(audio_path)
+        ranges = split_at_silence(audio, chunk_seconds)
+        futures = [self.submit(audio[start:end], **options) for start, end in ranges]
+        for (start, _), future in zip(ranges, futures):
+            yield from shift_segments(future.result().get("segments", []), start / SAMPLE_RATE)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return model load times and job counters."""
+        with self._lock:
+            return {
+                "model": self.model_size,
+                "workers": len(self._threads),
+                "load_seconds": list(self.load_seconds),
+                "jobs_done": self.jobs_done,
+                "jobs_failed": self.jobs_failed,
+                "pending": self._jobs.qsize(),
+                "avg_transcribe_seconds": self.transcribe_seconds / self.jobs_done if self.jobs_done else 0.0,
+            }
+
+    def close(self) -> None:
+        """Let the workers finish queued jobs, then stop them and release their models."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._jobs.put(None)
+        for thread in threads:
+            thread.join()
+        self._ready.clear()
+
+
+def split_at_silence(audio: np.ndarray, chunk_seconds: float = CHUNK_SECONDS,
+                     search_seconds: float = SILENCE_SEARCH_SECONDS,
+                     sample_rate: int = SAMPLE_RATE) -> List[Tuple[int, int]]:
+    """
+    Cut audio into chunks of about `chunk_seconds`, at the quietest nearby point.
+
+    Each cut is placed on the lowest-energy frame within `search_seconds` of
+    the nominal boundary, so words are rarely split between chunks.
+
+    Args:
+        audio: Mono samples, as returned by `whisper.load_audio`.
+        chunk_seconds: Target chunk length.
+        search_seconds: How far from the nominal boundary a cut may move.
+        sample_rate: Samples per second of `audio`.
+
+    Returns:
+        (start, end) sample ranges covering the whole audio, in order.
+    """
+    frame = max(1, int(SILENCE_FRAME_SECONDS * sample_rate))
+    chunk, search = int(chunk_seconds * sample_rate), int(search_seconds * sample_rate)
+    if len(audio) <= chunk + search:
+        return [(0, len(audio))]
+
+    # Per-frame energy, computed once for the whole file
+    usable = len(audio) // frame * frame
+    energy = np.square(audio[:usable].reshape(-1, frame)).mean(axis=1)
+
+    cuts, position = [0], 0
+    while len(audio) - position > chunk + search:
+        low = (position + chunk - search) // frame
+        high = min((position + chunk + search) // frame, len(energy))
+        quietest = low + int(np.argmin(energy[low:high]))
+        position = quietest * frame + frame // 2
+        cuts.append(position)
+    cuts.append(len(audio))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def shift_segments(segments: List[Dict[str, Any]], offset: float) -> List[Dict[str, Any]]:
+    """Move segments of a chunk starting `offset` seconds into the file to absolute time."""
+    return [dict(segment, start=segment["start"] + offset, end=segment["end"] + offset) for segment in segments]
+
+
+def _init_process(model_size: str, device: Optional[str], threads: int) -> None:
+    global _process_model
+    import torch
+    # Split the cores between pool processes instead of oversubscribing them
+    torch.set_num_threads(threads)
+    _process_model = whisper.load_model(model_size, device=device)
+
+
+def _transcribe_chunk(audio: np.ndarray, offset: float, options: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    result = _process_model.transcribe(audio, **options)
+    result["segments"] = shift_segments(result.get("segments", []), offset)
+    result["timing"] = {"transcribe_seconds": time.perf_counter() - started}
+    return result
+
+
+class ParallelTranscriber:
+    def __init__(self, model_size: str = WHISPER_MODEL, processes: int = WHISPER_PROCESSES,
+                 chunk_seconds: float = CHUNK_SECONDS, device: Optional[str] = WHISPER_DEVICE):
+        """
+        Transcribe long audio by splitting it at silences across a process pool.
+
+        Every pool process loads its own model once and keeps it for later
+        files. Segments come back with absolute timestamps, so the result can
+        be used exactly like a single `transcribe` call's. The processes are
+        spawned, so a script using this needs an `if __name__ == "__main__":` guard.
+
+        Args:
+            model_size: Whisper model name.
+            processes: Number of pool processes (CPU transcription).
+            chunk_seconds: Target chunk length; longer chunks mean fewer
+                boundaries, shorter ones more parallelism for short files.
+            device: Torch device for the pool processes.
+        """
+        self.model_size = model_size
+        self.processes = max(1, processes)
+        self.chunk_seconds = chunk_seconds
+        self.device = device
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                threads = max(1, (os.cpu_count() or 1) // self.processes)
+                # Spawned, not forked: this process may already hold torch/OpenMP state and
+                # TranscriptionService threads, which a forked child can deadlock on
+                self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_process,
+                                                 initargs=(self.model_size, self.device, threads))
+            return self._pool
+
+    def _submit(self, audio_path: str, chunk_seconds: float, options: Dict[str, Any]) -> List[Future]:
+        audio = whisper.load_audio(audio_path)
+        ranges = split_at_silence(audio, chunk_seconds)
+        print(f"Transcribing {len(audio) / SAMPLE_RATE:.0f}s of audio in {len(ranges)} chunks "
+              f"across {self.processes} processes...")
+        return [self.pool.submit(_transcribe_chunk, audio[start:end], start / SAMPLE_RATE, options)
+                for start, end in ranges]
+
+    def transcribe(self, audio_path: str, **options: Any) -> Dict[str, Any]:
+        """
+        Transcribe an audio file chunk by chunk in parallel.
+
+        Args:
+            audio_path: Path of the audio file.
+            **options: Passed on to `whisper.Whisper.transcribe` for every chunk.
+
+        Returns:
+            Whisper's result dict for the whole file ("text", "segments",
+            "language"), plus `timing` with the wall-clock and summed chunk seconds.
+        """
+        started = time.perf_counter()
+        results = [future.result() for future in self._submit(audio_path, self.chunk_seconds, options)]
+
+        segments = []
+        for result in results:
+            for segment in result.get("segments", []):
+                segments.append(dict(segment, id=len(segments)))
+        return {
+            "text": " ".join(r["text"].strip() for r in results if r.get("text", "").strip()),
+            "segments": segments,
+            "language": results[0].get("language") if results else None,
+            "timing": {
+                "wall_seconds": time.perf_counter() - started,
+                "transcribe_seconds": sum(r["timing"]["transcribe_seconds"] for r in results),
+                "chunks": len(results),
+            },
+        }
+
+    def iter_segments(self, audio_path: str, chunk_seconds: float = STREAM_CHUNK_SECONDS,
+                      **options: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Yield segments in order as the parallel chunks finish (see `TranscriptionService.iter_segments`).
+        """
+        for future in self._submit(audio_path, chunk_seconds, options):
+            yield from future.result().get("segments", [])
+
+    def close(self) -> None:
+        """Shut the pool down, releasing its processes and models."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def get_parallel_transcriber() -> ParallelTranscriber:
+    """Return the process-wide parallel transcriber, creating it on first use."""
+    global _parallel
+    with _service_lock:
+        if _parallel is None:
+            _parallel = ParallelTranscriber()
+        return _parallel
+
+
+def get_transcription_service() -> TranscriptionService:
+    """Return the process-wide transcription service, creating it on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TranscriptionService()
+        return _service
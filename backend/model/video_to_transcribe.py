@@ -1,6 +1,14 @@
 import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
 import yt_dlp
-import whisper
+from model.shards import append_segments, reset_segments, write_shard
+from model.transcript_cache import audio_hash, get_transcript_cache, whisper_audio_key, whisper_video_key
+from model.transcription import (WHISPER_MODEL_VERSION, WHISPER_PARALLEL, get_parallel_transcriber,
+                                 get_transcription_service)
+from model.youtube_transcriber import extract_video_id
 
 def download_audio(youtube_url, output_template):
     """
@@ -30,6 +38,25 @@ def download_audio(youtube_url, output_template):
     final_filename = output_template.replace('%(ext)s', 'mp3')
     return final_filename
 
+@contextmanager
+def downloaded_audio(youtube_url):
+    """
+    Download a video's audio into a directory of its own and delete it afterwards.
+
+    Concurrent downloads never share a file, so a transcript (and the cache
+    entries stored for it) always comes from the video it is stored under.
+
+    Yields:
+        str: Path of the downloaded audio file.
+    """
+    download_dir = tempfile.mkdtemp(prefix="audio_")
+    try:
+        audio_file = download_audio(youtube_url, os.path.join(download_dir, "audio.%(ext)s"))
+        print("Audio downloaded as", audio_file)
+        yield audio_file
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
 def group_transcript_by_minute(segments):
     """
     Groups Whisper transcription segments by 1-minute intervals.
@@ -53,30 +80,128 @@ def group_transcript_by_minute(segments):
     
     return transcript_by_minute
 
-def main_video(youtube_url):
+# Chunks embedded and added to the index at a time while a video streams in
+STREAM_INDEX_BATCH = 4
+
+def plain_segment(segment):
+    """Keep only the fields the transcript JSON and the cache need."""
+    return {"text": segment["text"].strip(), "start": segment["start"], "end": segment["end"]}
+
+def plain_segments(segments):
+    return [plain_segment(segment) for segment in segments]
+
+def transcribe_audio(audio_file, parallel=WHISPER_PARALLEL):
+    """
+    Transcribe an audio file, reusing the stored transcript of identical audio.
+
+    Parameters:
+        audio_file (str): Path of the audio file (downloaded or uploaded).
+        parallel (bool): Transcribe chunks across the process pool.
+
+    Returns:
+        list: Segments with 'text', 'start' and 'end'.
+    """
+    key = whisper_audio_key(audio_hash(audio_file), WHISPER_MODEL_VERSION)
+
+    def compute():
+        if parallel:
+            # Long lectures: split at silences and use every core
+            result = get_parallel_transcriber().transcribe(audio_file)
+            timing = result["timing"]
+            print(f"Transcribed {timing['chunks']} chunks in {timing['wall_seconds']:.1f}s "
+                  f"({timing['transcribe_seconds']:.1f}s of model time)")
+        else:
+            # The Whisper model stays loaded between videos (size set by WHISPER_MODEL)
+            service = get_transcription_service()
+            service.start()
+            print(f"Whisper model ready (loaded in {max(service.load_seconds):.1f}s)")
+
+            # Transcribe the audio file
+            print("Transcribing audio...")
+            result = service.transcribe(audio_file)
+            print(f"Transcribed in {result['timing']['transcribe_seconds']:.1f}s")
+        return plain_segments(result.get("segments", []))
+
+    return get_transcript_cache().get_or_compute(key, compute)
+
+def main_video(youtube_url, parallel=WHISPER_PARALLEL):
     # youtube_url = input("Enter YouTube URL: ").strip()
-    # Set the output template with a placeholder for the extension.
-    output_template = "audio.%(ext)s"
-    
-    # Download audio from YouTube and get the actual filename.
-    audio_file = download_audio(youtube_url, output_template)
-    print("Audio downloaded as", audio_file)
-    
-    # Load the Whisper model (choose model size as needed: tiny, base, small, medium, large)
-    print("Loading Whisper model...")
-    model = whisper.load_model("base")
-    
-    # Transcribe the audio file
-    print("Transcribing audio...")
-    result = model.transcribe(audio_file)
-    segments = result.get("segments", [])
-    
+
+    def download_and_transcribe():
+        # Download audio from YouTube into a private temporary directory
+        with downloaded_audio(youtube_url) as audio_file:
+            return transcribe_audio(audio_file, parallel)
+
+    # A video already transcribed with this model is neither downloaded nor transcribed again
+    video_id = extract_video_id(youtube_url)
+    if video_id:
+        segments = get_transcript_cache().get_or_compute(
+            whisper_video_key(video_id, WHISPER_MODEL_VERSION), download_and_transcribe)
+    else:
+        segments = download_and_transcribe()
+
     # Group the transcription into minute-wise segments
     transcript_by_minute = group_transcript_by_minute(segments)
     
-    # Save the result into a JSON file
-    output_json = r"A:\Projects\Edu_Pro\backend\data\single.json"
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(transcript_by_minute, f, ensure_ascii=False, indent=4)
-    print("Transcript saved to", output_json)
+    # Keep a per-video shard so ingesting this video does not replace the others
+    if video_id:
+        print("Transcript shard saved to", write_shard(video_id, transcript_by_minute))
+    else:
+        # Without a video id there is no shard to select, so it becomes the default transcript
+        output_json = r"A:\Projects\Edu_Pro\backend\data\single.json"
+        with open(output_json, "w", encoding="utf-8") as f:
+            json.dump(transcript_by_minute, f, ensure_ascii=False, indent=4)
+        print("Transcript saved to", output_json)
+
+
+def stream_video(youtube_url, parallel=WHISPER_PARALLEL):
+    """
+    Transcribe a video and make it searchable while transcription is still running.
+
+    Segments are appended to the shard's transcript.jsonl as they are produced
+    and their chunks are added to the shard's RAG index every few chunks. When
+    the video is done the shard source is written from the same segments, so
+    the final sync finds nothing new to embed.
+
+    Parameters:
+        youtube_url (str): The URL of the YouTube video.
+        parallel (bool): Transcribe chunks across the process pool.
+
+    Returns:
+        dict: Keys are minute indexes and values are the concatenated texts.
+    """
+    # Imported here: loading the RAG stack is only needed for incremental indexing
+    from model.rag import get_shard
+
+    video_id = extract_video_id(youtube_url)
+    if not video_id:
+        raise ValueError("Invalid YouTube URL. Could not extract video ID.")
+
+    cache = get_transcript_cache()
+    video_key = whisper_video_key(video_id, WHISPER_MODEL_VERSION)
+    cached = cache.get(video_key)
+    if cached is not None:
+        print(f"✅ Using stored transcript of {video_id}")
+        write_shard(video_id, cached)
+        get_shard(video_id)
+        return group_transcript_by_minute(cached)
+
+    transcriber = get_parallel_transcriber() if parallel else get_transcription_service()
+    segments = []
+
+    with downloaded_audio(youtube_url) as audio_file:
+        print("Streaming transcript to", reset_segments(video_id))
+
+        def stream():
+            for segment in map(plain_segment, transcriber.iter_segments(audio_file)):
+                append_segments(video_id, [segment])
+                segments.append(segment)
+                yield segment
+
+        added = get_shard(video_id).ingest(stream(), batch_size=STREAM_INDEX_BATCH)
+    print(f"✅ Indexed {added} chunks of {video_id} while transcribing")
 
+    cache.set(video_key, segments)
+    # Same segments as indexed, so syncing the shard re-embeds nothing
+    print("Transcript shard saved to", write_shard(video_id, segments))
+    return group_transcript_by_minute(segments)
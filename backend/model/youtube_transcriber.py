@@ -1,9 +1,77 @@
 import json
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from youtube_transcript_api import YouTubeTranscriptApi
 from youtube_transcript_api.formatters import JSONFormatter
-from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound, TooManyRequests
+from youtube_transcript_api._errors import (CouldNotRetrieveTranscript, TranscriptsDisabled, NoTranscriptFound,
+                                            TooManyRequests, YouTubeRequestFailed)
 import re
+from model.shards import DATA_DIR, playlist_shard_id, write_shard
+from model.transcript_cache import captions_key, get_transcript_cache
+
+# Batch fetching: parallel requests, a per-host request rate and retries with exponential backoff
+FETCH_CONCURRENCY = int(os.getenv("TRANSCRIPT_FETCH_CONCURRENCY", "8"))
+FETCH_RATE_PER_SECOND = float(os.getenv("TRANSCRIPT_FETCH_RATE", "4"))
+FETCH_MAX_RETRIES = int(os.getenv("TRANSCRIPT_FETCH_RETRIES", "6"))
+FETCH_BACKOFF_SECONDS = 2.0
+FETCH_MAX_BACKOFF_SECONDS = 120.0
+YOUTUBE_HOST = "www.youtube.com"
+# The only caption errors worth retrying; the others (no captions, unavailable or invalid video...) are permanent
+RETRYABLE_CAPTION_ERRORS = (TooManyRequests, YouTubeRequestFailed)
+
+# Fetched captions, one file per video, never rewritten; index.jsonl logs every fetch
+VIDEO_STORE_DIR = os.path.join(DATA_DIR, "videos")
+VIDEO_STORE_INDEX = "index.jsonl"
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+_store_lock = threading.Lock()
+
+
+class RateLimiter:
+    def __init__(self, rate, burst=1):
+        """
+        Thread-safe token bucket allowing `rate` requests per second.
+
+        Args:
+            rate: Sustained requests per second.
+            burst: Requests allowed back to back after an idle period.
+        """
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        """Hold back every request to this host for `seconds`, e.g. after being throttled."""
+        with self._lock:
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+def get_rate_limiter(host=YOUTUBE_HOST):
+    """Return the shared rate limiter for `host`."""
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter(FETCH_RATE_PER_SECOND)
+        return _rate_limiters[host]
 
 def extract_video_id(link):
     """
@@ -12,6 +80,70 @@ def extract_video_id(link):
     match = re.search(r"(?:v=|youtu\.be/)([a-zA-Z0-9_-]{11})", link)
     return match.group(1) if match else None
 
+def download_captions(video_id, max_retries=FETCH_MAX_RETRIES):
+    """
+    Download the captions of a video within the host's rate limit.
+
+    Throttling (TooManyRequests), failed requests and unexpected errors are
+    retried with exponential backoff and jitter; a throttled request also slows
+    down every other request to the host. Every other caption error, such as
+    a video without captions or an unavailable or invalid video, fails immediately.
+    """
+    limiter = get_rate_limiter()
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            return YouTubeTranscriptApi.get_transcript(video_id)
+        except Exception as e:
+            permanent = isinstance(e, CouldNotRetrieveTranscript) and not isinstance(e, RETRYABLE_CAPTION_ERRORS)
+            if permanent or attempt == max_retries:
+                raise
+            delay = min(FETCH_BACKOFF_SECONDS * 2 ** attempt, FETCH_MAX_BACKOFF_SECONDS)
+            delay *= random.uniform(0.5, 1.0)
+            if isinstance(e, TooManyRequests):
+                limiter.penalize(delay)
+            print(f"Retrying video {video_id} in {delay:.1f}s ({type(e).__name__})")
+            time.sleep(delay)
+
+def fetch_captions(video_id):
+    """Return the captions of a video, downloading them only if they are not cached."""
+    return get_transcript_cache().get_or_compute(captions_key(video_id), lambda: download_captions(video_id))
+
+def video_store_path(video_id):
+    return os.path.join(VIDEO_STORE_DIR, f"{video_id}.json")
+
+def store_video(video_id, captions, status="ok"):
+    """
+    Record a fetched video in the append-only store.
+
+    A video's captions file is written once and never rewritten; every fetch,
+    including failures, is appended to the index log.
+    """
+    os.makedirs(VIDEO_STORE_DIR, exist_ok=True)
+    path = video_store_path(video_id)
+    if captions is not None and not os.path.exists(path):
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(captions, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+    entry = {"video_id": video_id, "status": status, "captions": len(captions or []),
+             "fetched_at": datetime.utcnow().isoformat()}
+    with _store_lock, open(os.path.join(VIDEO_STORE_DIR, VIDEO_STORE_INDEX), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+def read_video_store(video_ids=None):
+    """Return {video_id: captions} for the stored videos, or for `video_ids` only."""
+    if video_ids is None:
+        video_ids = [name[:-5] for name in os.listdir(VIDEO_STORE_DIR) if name.endswith(".json")] \
+            if os.path.isdir(VIDEO_STORE_DIR) else []
+    transcripts = {}
+    for video_id in video_ids:
+        try:
+            with open(video_store_path(video_id), "r", encoding="utf-8") as f:
+                transcripts[video_id] = json.load(f)
+        except FileNotFoundError:
+            pass
+    return transcripts
+
 def get_transcript_one(video_link):
     try:
         # Extract video ID
@@ -21,11 +153,11 @@ def get_transcript_one(video_link):
             raise ValueError("Invalid YouTube URL. Could not extract video ID.")
 
         print(f"Fetching transcript for video: {video_id}")
-        transcript = YouTubeTranscriptApi.get_transcript(video_id)
+        transcript = fetch_captions(video_id)
         formatter = JSONFormatter()
         json_formatted = formatter.format_transcript(transcript)
-        with open(r"A:\Projects\Edu_Pro\backend\data\single.json", "w", encoding="utf-8") as file:
-            file.write(json_formatted)
+        # Chats select the video's shard; the default transcript is left alone
+        write_shard(video_id, json.loads(json_formatted))
         print(f"✅ Single transcript generated successfully for video: {video_id}")
         return json_formatted
 
@@ -49,42 +181,56 @@ def get_transcript_one(video_link):
         print(f"❌ Unexpected error: {e}")
         return None
 
-def get_transcript_all(video_ids):
-    json_file_path = 'data/multi.json'
-    
+def fetch_one(video_id):
+    """Fetch one video of a batch, returning its captions or None; never raises."""
     try:
-        if os.path.exists(json_file_path):
-            with open(json_file_path, 'r', encoding='utf-8') as file:
-                transcripts = json.load(file)
-                if not isinstance(transcripts, list):
-                    transcripts = []
-        else:
-            transcripts = []
-    except (FileNotFoundError, json.JSONDecodeError):
-        transcripts = []
-    
-    formatter = JSONFormatter()
-    
-    for video_id in video_ids:
-        try:
-            print(f"Fetching transcript for video: {video_id}")
-            transcript = YouTubeTranscriptApi.get_transcript(video_id)
-            json_formatted = json.loads(formatter.format_transcript(transcript))
-            transcripts.extend(json_formatted)
-
-            print(f"✅ Transcript added for video: {video_id}")
-
-        except TranscriptsDisabled:
-            print(f"❌ Error: Transcripts are disabled for video {video_id}. Skipping...")
-        except NoTranscriptFound:
-            print(f"❌ Error: No transcript found for video {video_id}. Skipping...")
-        except TooManyRequests:
-            print("❌ Error: Too many requests. Please wait and try again later.")
-            break
-        except Exception as e:
-            print(f"❌ Unexpected error for video {video_id}: {e}. Skipping...")
+        print(f"Fetching transcript for video: {video_id}")
+        captions = fetch_captions(video_id)
+        store_video(video_id, captions)
+        print(f"✅ Transcript added for video: {video_id}")
+        return captions
+    except TranscriptsDisabled:
+        print(f"❌ Error: Transcripts are disabled for video {video_id}. Skipping...")
+        store_video(video_id, None, "disabled")
+    except NoTranscriptFound:
+        print(f"❌ Error: No transcript found for video {video_id}. Skipping...")
+        store_video(video_id, None, "not_found")
+    except TooManyRequests:
+        print(f"❌ Error: Still rate limited after retries for video {video_id}. Skipping...")
+        store_video(video_id, None, "rate_limited")
+    except Exception as e:
+        print(f"❌ Unexpected error for video {video_id}: {e}. Skipping...")
+        store_video(video_id, None, "error")
+    return None
 
-    with open(json_file_path, 'w', encoding='utf-8') as json_file:
-        json.dump(transcripts, json_file, ensure_ascii=False, indent=4)
-    
-    print("✅ Multi transcript JSON updated successfully!")
+def get_transcript_all(video_ids, playlist_id=None, concurrency=FETCH_CONCURRENCY):
+    """
+    Fetch the captions of many videos concurrently and write a playlist shard.
+
+    Requests run on `concurrency` threads under the shared per-host rate limit;
+    throttled requests back off and retry instead of aborting the batch.
+    Captions are added to the append-only video store as they arrive.
+
+    Returns:
+        The playlist shard id.
+    """
+    video_ids = list(dict.fromkeys(video_ids))
+    playlist_id = playlist_id or playlist_shard_id(video_ids)
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        results = list(pool.map(fetch_one, video_ids))
+
+    playlist_transcripts = []
+    for video_id, captions in zip(video_ids, results):
+        if captions:
+            # Tag captions with their video so playlist searches can filter by video
+            playlist_transcripts.extend(dict(item, video_id=video_id) for item in captions)
+
+    if playlist_transcripts:
+        write_shard(playlist_id, playlist_transcripts)
+        print(f"✅ Playlist shard {playlist_id} written with {len(playlist_transcripts)} captions")
+
+    fetched = sum(captions is not None for captions in results)
+    print(f"✅ Fetched {fetched}/{len(video_ids)} transcripts in {time.perf_counter() - started:.1f}s")
+    return playlist_id
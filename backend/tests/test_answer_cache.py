@@ -0,0 +1,32 @@
+import numpy as np
+
+from model.answer_cache import SemanticAnswerCache
+
+CORPUS = ("single.json", 1)
+
+
+def unit(*values) -> np.ndarray:
+    vector = np.array(values, dtype='float32')
+    return vector / np.linalg.norm(vector)
+
+
+def test_hit_requires_identical_math_terms():
+    cache = SemanticAnswerCache(threshold=0.95)
+    # Same embedding for every question: only the math terms tell them apart
+    embedding = unit(1.0, 0.0, 0.0)
+    cache.set(CORPUS, embedding, "x = 2", "solve 2x + 3 = 7")
+    cache.set(CORPUS, embedding, "2x", "derivative of x^2")
+
+    assert cache.get(CORPUS, embedding, "Solve 2x + 3 = 7") == "x = 2"
+    assert cache.get(CORPUS, embedding, "solve 2x + 3 = 9") is None
+    assert cache.get(CORPUS, embedding, "solve 2x - 3 = 7") is None
+    assert cache.get(CORPUS, embedding, "derivative of x^2") == "2x"
+    assert cache.get(CORPUS, embedding, "derivative of x^3") is None
+
+
+def test_matching_terms_still_need_similar_embeddings():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.set(CORPUS, unit(1.0, 0.0, 0.0), "limits answer", "what is a limit")
+
+    assert cache.get(CORPUS, unit(0.99, 0.1, 0.0), "what's a limit") == "limits answer"
+    assert cache.get(CORPUS, unit(0.0, 1.0, 0.0), "what is a series") is None
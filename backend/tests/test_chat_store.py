@@ -0,0 +1,192 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("motor")
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from model.chat_store import BUCKET_SIZE, ChatStore, WriteBehindBuffer
+
+
+def make_store() -> ChatStore:
+    return ChatStore(mongomock_motor.AsyncMongoMockClient()["chatbot_db"])
+
+
+class RecordingCollection:
+    """Applies the UpdateOne ops of bulk_write to plain dicts and records each call."""
+
+    def __init__(self):
+        self.docs = []
+        self.bulk_writes = []
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+    async def bulk_write(self, requests, ordered=True):
+        self.bulk_writes.append((requests, ordered))
+        for request in requests:
+            self._apply(request._filter, request._doc, request._upsert)
+
+    def _matches(self, doc, query):
+        for field, condition in query.items():
+            if isinstance(condition, dict):
+                if not doc.get(field, 0) < condition["$lt"]:
+                    return False
+            elif doc.get(field) != condition:
+                return False
+        return True
+
+    def _apply(self, query, update, upsert):
+        doc = next((d for d in self.docs if self._matches(d, query)), None)
+        if doc is None:
+            assert upsert
+            doc = {field: value for field, value in query.items() if not isinstance(value, dict)}
+            doc.update(update.get("$setOnInsert", {}))
+            self.docs.append(doc)
+        doc.update(update.get("$set", {}))
+        for field, amount in update.get("$inc", {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        for field, value in update.get("$push", {}).items():
+            doc.setdefault(field, []).append(value)
+
+
+def test_first_write_creates_indexes():
+    async def run():
+        store = make_store()
+        await store.create_or_get_chat("algebra")
+        return await store.sessions.index_information(), await store.buckets.index_information()
+
+    sessions, buckets = asyncio.run(run())
+    assert any(info["key"] == [("chat_name", 1)] and info.get("unique") for info in sessions.values())
+    assert any(info["key"] == [("chat_name", 1), ("count", 1)] for info in buckets.values())
+
+
+def test_create_or_get_chat_returns_existing_session():
+    async def run():
+        store = make_store()
+        created = await store.create_or_get_chat("algebra")
+        existing = await store.create_or_get_chat("algebra")
+        return created, existing
+
+    created, existing = asyncio.run(run())
+    assert created[0] == "Chat Created Successfully"
+    assert existing == created[1]
+
+
+def test_messages_fill_buckets_in_order():
+    async def run():
+        store = make_store()
+        await store.create_or_get_chat("algebra")
+        for i in range(BUCKET_SIZE + 5):
+            await store.store_message("algebra", f"q{i}", f"a{i}")
+        counts = [bucket["count"] async for bucket in store.buckets.find({"chat_name": "algebra"})]
+        return counts, await store.get_chat_pairs("algebra")
+
+    counts, pairs = asyncio.run(run())
+    assert sorted(counts) == [5, BUCKET_SIZE]
+    assert [p["human"] for p in pairs] == [f"q{i}" for i in range(BUCKET_SIZE + 5)]
+
+
+def test_get_messages_accepts_timezone_aware_cursors():
+    async def run():
+        store = make_store()
+        await store.create_or_get_chat("algebra")
+        for i in range(5):
+            await store.store_message("algebra", f"q{i}", f"a{i}")
+            await asyncio.sleep(0.002)
+        latest = await store.get_messages("algebra", limit=2)
+        # A client sending "...Z" gets an aware datetime from FastAPI
+        cursor = latest["before"].replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=2)))
+        older = await store.get_messages("algebra", limit=10, before=cursor)
+        chats = await store.list_chats(before=datetime.now(timezone.utc) + timedelta(minutes=1))
+        return latest, older, chats
+
+    latest, older, chats = asyncio.run(run())
+    assert [m["human"] for m in latest["messages"]] == ["q3", "q4"]
+    assert [m["human"] for m in older["messages"]] == ["q0", "q1", "q2"]
+    assert [c["chat_name"] for c in chats["chats"]] == ["algebra"]
+
+
+def test_write_behind_spills_a_failing_batch_and_keeps_writing(tmp_path):
+    store = make_store()
+
+    async def reject_bad_turns(turns):
+        if any(message["human"] == "bad" for _, message in turns):
+            raise ValueError("document failed validation")
+        # One write per turn: mongomock's bulk_write lags behind pymongo's UpdateOne
+        for chat_name, message in turns:
+            await store.store_message(chat_name, message["human"], message["AI"])
+
+    store.store_messages = reject_bad_turns
+    spill_path = tmp_path / "spill.jsonl"
+
+    async def run():
+        buffer = WriteBehindBuffer(store, batch_size=1, interval=0.01, max_retries=2, spill_path=str(spill_path))
+        for human in ("good", "bad", "later"):
+            await buffer.submit("algebra", human, "answer")
+        await buffer.close(timeout=5)
+        return buffer.stats(), await store.get_chat_pairs("algebra")
+
+    stats, pairs = asyncio.run(run())
+    assert [p["human"] for p in pairs] == ["good", "later"]
+    assert stats["spilled"] == 1 and stats["retries"] == 2
+    spilled = [json.loads(line) for line in spill_path.read_text(encoding="utf-8").splitlines()]
+    assert [(s["chat_name"], s["human"]) for s in spilled] == [("algebra", "bad")]
+
+
+def test_store_messages_rolls_buckets_and_touches_each_session_once():
+    store = ChatStore(SimpleNamespace(chat_history=RecordingCollection(), chat_messages=RecordingCollection()))
+    start = datetime(2024, 1, 1)
+    turns = [("algebra", {"human": f"q{i}", "AI": f"a{i}", "timestamp": start + timedelta(seconds=i)})
+             for i in range(BUCKET_SIZE + 3)]
+    turns.insert(10, ("calculus", {"human": "c0", "AI": "d0", "timestamp": start}))
+    turns.append(("calculus", {"human": "c1", "AI": "d1", "timestamp": start + timedelta(hours=1)}))
+
+    asyncio.run(store.store_messages(turns))
+
+    (bucket_ops, ordered), = store.buckets.bulk_writes
+    assert len(bucket_ops) == len(turns) and ordered
+    algebra = [b for b in store.buckets.docs if b["chat_name"] == "algebra"]
+    assert [b["count"] for b in algebra] == [BUCKET_SIZE, 3]
+    assert [m["human"] for b in algebra for m in b["messages"]] == [f"q{i}" for i in range(BUCKET_SIZE + 3)]
+    assert algebra[1]["first_timestamp"] == start + timedelta(seconds=BUCKET_SIZE)
+
+    (session_ops, _), = store.sessions.bulk_writes
+    updates = {op._filter["chat_name"]: op._doc for op in session_ops}
+    assert len(session_ops) == 2
+    assert updates["algebra"]["$inc"] == {"message_count": BUCKET_SIZE + 3}
+    assert updates["calculus"]["$inc"] == {"message_count": 2}
+    assert updates["calculus"]["$set"]["timestamp"] == start + timedelta(hours=1)
+
+
+def test_write_behind_reports_turns_until_they_are_written():
+    store = make_store()
+    written = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_store_messages(turns):
+        for chat_name, message in turns:
+            await store.store_message(chat_name, message["human"], message["AI"])
+        written.set()
+        await release.wait()
+
+    store.store_messages = slow_store_messages
+
+    async def run():
+        buffer = WriteBehindBuffer(store, batch_size=2, interval=0.01)
+        await buffer.submit("algebra", "q0", "a0")
+        await buffer.submit("calculus", "c0", "d0")
+        queued = [m["human"] for m in buffer.pending_messages("algebra")]
+        await written.wait()
+        # Stored but the flush has not returned yet: still reported
+        in_flight = [m["human"] for m in buffer.pending_messages("algebra")]
+        release.set()
+        await buffer.close(timeout=5)
+        return queued, in_flight, buffer.pending_messages("algebra")
+
+    queued, in_flight, after = asyncio.run(run())
+    assert queued == ["q0"] and in_flight == ["q0"] and after == []
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("langchain_google_genai")
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+from model import chat_store
+from model.chat_store import ChatStore, WriteBehindBuffer
+from model.memory import ConversationMemory
+
+
+def test_history_includes_turns_still_in_the_write_behind_buffer(monkeypatch):
+    store = ChatStore(mongomock_motor.AsyncMongoMockClient()["chatbot_db"])
+    memory = ConversationMemory(store=store, llm=object())
+
+    async def store_each(turns):
+        # One write per turn: mongomock's bulk_write lags behind pymongo's UpdateOne
+        for chat_name, message in turns:
+            await store.store_message(chat_name, message["human"], message["AI"])
+
+    store.store_messages = store_each
+
+    async def run():
+        buffer = WriteBehindBuffer(store, batch_size=10, interval=60)
+        monkeypatch.setattr(chat_store, "_write_buffer", buffer)
+        await store.store_message("algebra", "what is a limit", "the value f approaches")
+        await buffer.submit("algebra", "and a derivative", "the limit of the difference quotient")
+        history = await memory.build_history("algebra")
+        await buffer.close(timeout=5)
+        return history, await memory.build_history("algebra")
+
+    buffered, flushed = asyncio.run(run())
+    for history in (buffered, flushed):
+        assert history.count("Student:") == 2
+        assert history.index("what is a limit") < history.index("and a derivative")
@@ -0,0 +1,60 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("sentence_transformers")
+
+from model import rag, shards
+
+WORDS = ["limits", "derivative", "integral", "series"]
+
+
+class BagOfWordsEncoder:
+    """Deterministic stand-in for the sentence-transformer: hashed word counts."""
+
+    def encode(self, texts, **kwargs):
+        vectors = np.full((len(texts), 64), 0.01, dtype='float32')
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+        return vectors
+
+
+@pytest.fixture
+def shards_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(shards, "SHARDS_DIR", str(tmp_path / "shards"))
+    monkeypatch.setattr(rag, "get_encoder", lambda model_name=rag.DEFAULT_MODEL_NAME: BagOfWordsEncoder())
+    return tmp_path
+
+
+def segment(i):
+    return {"text": f"segment {i} explains {WORDS[i // 10]} " + "with worked examples " * 20,
+            "start": i * 10.0, "end": i * 10.0 + 10}
+
+
+def test_streaming_shard_is_searchable_between_batches(shards_dir):
+    shard_id = "streamvideo1"
+    shards.reset_segments(shard_id)
+    assert shards.list_shards() == [shard_id]
+    found = []
+
+    def stream():
+        for i in range(len(WORDS) * 10):
+            shards.append_segments(shard_id, [segment(i)])
+            yield segment(i)
+            if i % 10 == 9:
+                # A separate system over the same index_dir, as another process would have
+                reader = rag.RAGSystem(shards.shard_source_path(shard_id), index_dir=shards.shard_index_dir(shard_id))
+                results = rag.search_shards(WORDS[i // 10], [shard_id], top_k=1)
+                found.append((len(reader.documents), results[0]["content"]))
+
+    ingester = rag.RAGSystem(shards.shard_source_path(shard_id), index_dir=shards.shard_index_dir(shard_id))
+    added = ingester.ingest(stream(), batch_size=2, save_every=1)
+
+    assert not (shards_dir / "shards" / shard_id / shards.SHARD_SOURCE_FILE).exists()
+    counts = [count for count, _ in found]
+    assert counts == sorted(counts) and 0 < counts[0] and counts[-1] <= added
+    for word, (_, content) in zip(WORDS, found):
+        assert word in content